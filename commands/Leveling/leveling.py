@@ -1,14 +1,19 @@
 import discord
 from discord.ext import commands, tasks
 import sqlite3
+import aiosqlite
 import random
+import functools
 import math
 import time
 import os
 import json
 import asyncio
+import contextlib
+import copy
 import logging
-from typing import Dict, List, Tuple, Optional
+import weakref
+from typing import Callable, Dict, List, Tuple, Optional
 
 # Configure logging
 logging.basicConfig(
@@ -22,7 +27,47 @@ logging.basicConfig(
 
 # Dosya adları ve yapılandırma
 DB_NAME = "levels.db"
+XP_FLUSH_INTERVAL_SECONDS = 5 # Bekleyen XP güncellemelerinin DB'ye yazılma aralığı
+XP_FLUSH_BATCH_SIZE = 50 # Bu kadar kayıt birikirse aralık beklenmeden yazılır
+XP_WRITE_TRANSACTION_SIZE = 200 # Tek bir yazma işleminde (BEGIN IMMEDIATE ... COMMIT) en fazla kayıt
+RANK_THRESHOLD_REFRESH_SECONDS = 60 # Sıralama eşiği XP'sinin yenilenme aralığı
+COOLDOWN_PRUNE_INTERVAL_SECONDS = 300 # Süresi dolmuş XP bekleme kayıtlarının temizlenme aralığı
+SQL_IN_CHUNK_SIZE = 900 # SQLite parametre sınırının (999) altında kalan IN (...) parça boyutu
+ROLE_CORRECTION_CONCURRENCY = 10 # Başlangıçta aynı anda düzeltilecek en fazla üye sayısı
+CONFIG_FLUSH_DELAY_SECONDS = 1.0 # Son yapılandırma değişikliğinden sonra dosyaya yazmadan önce beklenen süre
+USER_DATA_CACHE_TTL_SECONDS = 30 # Okunan kullanıcı verisinin bellekte tutulma süresi (XP bekleme süresinden kısa)
+LB_CURSOR_TTL_SECONDS = 300 # Liderlik tablosunda bir sonraki sayfanın başlangıç imlecinin geçerlilik süresi
+LB_COUNT_CACHE_TTL_SECONDS = 30 # Liderlik tablosundaki sıralanan üye sayısının önbellekte tutulma süresi
+LB_MAX_PAGE = 10_000 # İstenebilecek en büyük liderlik sayfası (aşırı OFFSET'li sorguları önler)
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "leveling_config.json")
+# Sık kullanılan SQL ifadeleri; aynı metin sqlite3'ün ifade önbelleğinde tekrar kullanılır
+SQL_SELECT_USER = "SELECT level, xp, total_xp FROM users WHERE user_id = ? AND guild_id = ?"
+# INSERT OR REPLACE satırı silip yeniden eklerken UPSERT mevcut satırı yerinde günceller (rowid ve indeks sayfaları korunur)
+SQL_UPSERT_USER = (
+    "INSERT INTO users (user_id, guild_id, level, xp, total_xp) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id, guild_id) DO UPDATE SET level = excluded.level, xp = excluded.xp, total_xp = excluded.total_xp"
+)
+# "total_xp > 0" koşulu kısmi ix_users_guild_xp indeksinin kullanılabilmesini sağlar
+SQL_USER_RANK = "SELECT 1 + COUNT(*) FROM users WHERE guild_id = ? AND total_xp > 0 AND total_xp > ?"
+SQL_RANK_THRESHOLD_XP = (
+    "SELECT total_xp FROM users WHERE guild_id = ? AND total_xp > 0 ORDER BY total_xp DESC LIMIT 1 OFFSET ?"
+)
+SQL_LB_COUNT = "SELECT COUNT(*) FROM users WHERE guild_id = ? AND total_xp > 0"
+SQL_LB_PAGE = (
+    "SELECT user_id, level, total_xp FROM users WHERE guild_id = ? AND total_xp > 0 "
+    "ORDER BY total_xp DESC, user_id DESC LIMIT ? OFFSET ?"
+)
+# Keyset sayfalama: önceki sayfanın son (total_xp, user_id) değerinden sonrası
+SQL_LB_PAGE_AFTER = (
+    "SELECT user_id, level, total_xp FROM users WHERE guild_id = ? AND total_xp > 0 "
+    "AND (total_xp, user_id) < (?, ?) ORDER BY total_xp DESC, user_id DESC LIMIT ?"
+)
+# Komut hata işleyicilerinin ortak mesajları: hata tipi -> mesaj (veya hatadan mesaj üreten fonksiyon)
+_ERR_MAP: Dict[type, object] = {
+    commands.MissingPermissions: "❌ Bu komutu kullanmak için 'Sunucuyu Yönet' iznine sahip olmalısınız.",
+    commands.MemberNotFound: lambda e: f"❌ Üye bulunamadı: `{e.argument}`. Lütfen geçerli bir üye etiketleyin.",
+    commands.CommandOnCooldown: lambda e: f"⏳ Bu komutu tekrar kullanmak için {e.retry_after:.1f} saniye beklemelisiniz.",
+}
 DEFAULT_CONFIG = {
     "xp_range": {"min": 15, "max": 25},
     "xp_cooldown_seconds": 60,
@@ -33,19 +78,79 @@ DEFAULT_CONFIG = {
     "xp_boosts": {}
 }
 
+class _ResetConfirm(discord.ui.View):
+    """Confirm/cancel buttons for the XP reset command."""
+
+    def __init__(self, author_id: int, timeout: float = 15.0):
+        super().__init__(timeout=timeout)
+        self.author_id = author_id
+        self.value: Optional[bool] = None # True: onaylandı, False: iptal, None: süre doldu
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Sadece komutu kullanan kişi onaylayabilir
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("❌ Bu onay size ait değil.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="Onayla", emoji="✅", style=discord.ButtonStyle.danger)
+    async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.value = True
+        await interaction.response.defer()
+        self.stop()
+
+    @discord.ui.button(label="İptal", emoji="❌", style=discord.ButtonStyle.secondary)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.value = False
+        await interaction.response.defer()
+        self.stop()
+
 class LevelingCog(commands.Cog, name="Seviye Sistemi"):
     """Geliştirilmiş XP, Seviye, Seviye Rolleri ve Admin Komutları Sistemi."""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.user_message_cooldowns: Dict[int, Dict[int, float]] = {}
-        self.conn: Optional[sqlite3.Connection] = None
-        self.cursor: Optional[sqlite3.Cursor] = None
+        self._last_msg: Dict[Tuple[int, int], float] = {} # (guild_id, user_id) -> son XP kazanılan mesaj zamanı
+        self._prefix_cache: Dict[int, Tuple[str, ...]] = {} # guild_id -> komut prefix'leri
+        self.db: Optional[aiosqlite.Connection] = None # Okuma bağlantısı
+        # Tüm yazmalar kendi iş parçacığına sahip tek bir yazıcı bağlantısından geçer (SQLite tek yazıcı kabul eder)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        # Üye başına kilit: XP okuma-değiştirme-yazma adımları arasında await olduğundan aynı üyeye yapılan
+        # eşzamanlı değişiklikler birbirinin üzerine yazmasın. Kullanılmayan kilitler kendiliğinden silinir
+        self._user_locks: "weakref.WeakValueDictionary[Tuple[int, int], asyncio.Lock]" = weakref.WeakValueDictionary()
+        # Henüz DB'ye yazılmamış XP güncellemeleri: (guild_id, user_id) -> (level, xp, total_xp)
+        self._pending: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+        # Kısa ömürlü okuma önbelleği: (guild_id, user_id) -> (okunma zamanı, (level, xp, total_xp))
+        self._user_cache: Dict[Tuple[int, int], Tuple[float, Tuple[int, int, int]]] = {}
+        # Liderlik tablosu imleçleri: (guild_id, author_id, sayfa) -> (oluşturulma zamanı, (önceki sayfanın son total_xp'si, user_id'si))
+        self._lb_cursors: Dict[Tuple[int, int, int], Tuple[float, Tuple[int, int]]] = {}
+        self._lb_count_cache: Dict[int, Tuple[float, int]] = {} # guild_id -> (okunma zamanı, sıralanan üye sayısı)
+        self._lb_template: Dict[int, discord.Embed] = {} # guild_id -> başlık/renk hazır liderlik tablosu embed'i
         self.config: Dict = DEFAULT_CONFIG.copy()
+        self._cfg_dirty = False # Yapılandırma değişti ama henüz dosyaya yazılmadı
+        self._cfg_flush_task: Optional[asyncio.Task] = None # Zamanlanmış (geciktirilmiş) yapılandırma yazımı
         self.rank_removal_threshold: Optional[int] = None
+        # guild_id -> eşik sıradaki (rank_removal_threshold) kullanıcının total_xp değeri
+        self._threshold_xp: Dict[int, int] = {}
+        # level_roles config'inin sayıya çevrilmiş hali (_load_config içinde doldurulur)
+        self._level_role_ids: Dict[int, int] = {} # seviye -> rol ID
+        self._role_id_to_level: Dict[int, int] = {} # rol ID -> seviye
+        self._all_level_role_ids: set = set()
+        # xp_boosts config'inin sayıya çevrilmiş hali: üye veya rol ID -> çarpan (Discord ID'leri türler arasında benzersizdir)
+        self._boosts: Dict[int, float] = {}
+        self._blacklist: set = set() # XP verilmeyen kanal ID'leri
+        # Çarpan -> o çarpanla kazanılabilecek XP değerlerinden birini seçen fonksiyon
+        self._xp_draw: Dict[float, Callable[[], int]] = {}
         self.logger = logging.getLogger("LevelingCog")
         self._load_config()
-        self._init_db()
+        self._first_init = not os.path.exists(DB_NAME) # Veritabanı dosyası bu başlatmada mı oluşturulacak?
+        # Veritabanı bağlantısı event loop'u bloklamamak için asenkron açılır
+        self._db_init_task = self.bot.loop.create_task(self._init_db())
+        self._flush_xp.start()
+        self._refresh_threshold_xp.start()
+        self._prune_cooldowns.start()
         # Schedule role correction after bot is ready
         self.bot.loop.create_task(self._correct_level_roles_on_startup())
 
@@ -82,93 +187,332 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         except json.JSONDecodeError as e:
             self.logger.error(f"Yapılandırma dosyası JSON formatı hatalı: {e}. Varsayılan yapılandırma kullanılıyor.")
             self.config = DEFAULT_CONFIG.copy()
-            self._save_config() # Hata durumunda varsayılanı kaydet
+            self._mark_cfg_dirty() # Hata durumunda varsayılanı kaydet
             self.rank_removal_threshold = None
         except Exception as e:
             self.logger.error(f"Yapılandırma yüklenirken hata: {e}. Varsayılan yapılandırma kullanılıyor.")
             self.config = DEFAULT_CONFIG.copy()
-            self._save_config() # Hata durumunda varsayılanı kaydet
+            self._mark_cfg_dirty() # Hata durumunda varsayılanı kaydet
             self.rank_removal_threshold = None
 
+        self._build_level_role_cache()
+        self._build_boost_cache()
+        self._build_blacklist_cache()
 
-    def _save_config(self):
-        """Save the current configuration to the JSON file."""
+    def _build_level_role_cache(self):
+        """Parse the level_roles config once into integer lookups."""
+        level_role_ids = {}
+        for level_str, role_id_str in self.config.get("level_roles", {}).items():
+            try:
+                level_role_ids[int(level_str)] = int(role_id_str)
+            except (ValueError, TypeError):
+                self.logger.error(f"Geçersiz seviye veya rol ID, atlanıyor: Seviye {level_str}, Rol ID {role_id_str}")
+        self._level_role_ids = level_role_ids
+        self._role_id_to_level = {role_id: level for level, role_id in level_role_ids.items()}
+        self._all_level_role_ids = set(level_role_ids.values())
+
+    def _build_boost_cache(self):
+        """Parse the xp_boosts config once into an integer-keyed lookup."""
+        boosts = {}
+        for target_id_str, multiplier in self.config.get("xp_boosts", {}).items():
+            try:
+                boosts[int(target_id_str)] = float(multiplier)
+            except (ValueError, TypeError):
+                self.logger.error(f"Geçersiz XP çarpanı, atlanıyor: ID {target_id_str}, Çarpan {multiplier}")
+        self._boosts = boosts
+        self._build_xp_draw_cache()
+
+    def _build_xp_draw_cache(self):
+        """Precompute the possible XP rewards for every distinct boost multiplier.
+
+        Each table holds int(base_xp * boost) for every base_xp in xp_range, so drawing
+        from it gives exactly the same distribution as randint + multiply.
+        """
+        self._xp_draw = {boost: self._make_xp_draw(boost) for boost in {1.0, *self._boosts.values()}}
+
+    def _make_xp_draw(self, boost: float) -> Callable[[], int]:
+        """Build the XP draw function for a single boost multiplier."""
+        xp_range = self.config.get("xp_range", {"min": 15, "max": 25})
+        base_values = range(xp_range["min"], xp_range["max"] + 1)
+        return functools.partial(random.choice, tuple(int(base_xp * boost) for base_xp in base_values))
+
+    def _build_blacklist_cache(self):
+        """Mirror the blacklisted_channels list into a set for O(1) membership tests."""
+        blacklist = set()
+        for channel_id in self.config.get("blacklisted_channels", []):
+            try:
+                blacklist.add(int(channel_id))
+            except (ValueError, TypeError):
+                self.logger.error(f"Geçersiz engelli kanal ID'si, atlanıyor: {channel_id}")
+        self._blacklist = blacklist
+
+    def _mark_cfg_dirty(self):
+        """Mark the configuration as changed and schedule a delayed write to the JSON file."""
+        self._cfg_dirty = True
+        if self._cfg_flush_task is None or self._cfg_flush_task.done():
+            self._cfg_flush_task = self.bot.loop.create_task(self._delayed_flush())
+
+    def _write_config(self, data: str) -> bool:
+        """Atomically write serialized configuration to the JSON file. Runs in a worker thread."""
+        tmp_path = CONFIG_FILE + ".tmp"
         try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=4)
+            # Önce geçici dosyaya yaz, sonra yerine koy: yazma yarıda kesilirse eski dosya bozulmadan kalır
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, CONFIG_FILE)
             self.logger.info(f"Yapılandırma '{CONFIG_FILE}' dosyasına kaydedildi.")
+            return True
         except Exception as e:
             self.logger.error(f"Yapılandırma kaydedilirken hata: {e}")
+            return False
+
+    async def _flush_config_now(self):
+        """Write the configuration to disk if it changed, without blocking the event loop."""
+        if not self._cfg_dirty:
+            return
+        self._cfg_dirty = False
+        # Serileştirme event loop'ta yapılır ki komutlar yazma sırasında config'i değiştirse de tutarlı kalsın
+        data = json.dumps(self.config, indent=4, ensure_ascii=False)
+        if not await asyncio.to_thread(self._write_config, data):
+            self._cfg_dirty = True # Bir sonraki turda tekrar dene
+
+    async def _delayed_flush(self):
+        """Write the configuration shortly after the last edit, coalescing bursts of edits."""
+        # Yazma sırasında gelen değişiklikler de aynı görevde bir sonraki turda yazılır
+        while self._cfg_dirty:
+            await asyncio.sleep(CONFIG_FLUSH_DELAY_SECONDS)
+            await self._flush_config_now()
 
     # --- Database Management ---
-    def _init_db(self):
+    async def _init_db(self):
         """Initialize the SQLite database with necessary tables and indexes."""
+        db = None
+        writer = None
         try:
-            self.conn = sqlite3.connect(DB_NAME)
-            self.cursor = self.conn.cursor()
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    level INTEGER DEFAULT 0,
-                    xp INTEGER DEFAULT 0,
-                    total_xp INTEGER DEFAULT 0,
-                    PRIMARY KEY (user_id, guild_id)
+            # Yazıcı bağlantısı işlemleri kendisi açıp kapatır (autocommit + _transaction)
+            writer = await aiosqlite.connect(DB_NAME, isolation_level=None)
+            if self._first_init:
+                self.logger.warning(f"'{DB_NAME}' veritabanı dosyası bulunamadı, yeni veritabanı oluşturuluyor.")
+            await writer.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-20000;
+            """)
+            # Şema adımları tek bir işlemde, tek commit ile uygulanır
+            async with self._transaction(writer):
+                await writer.execute("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        user_id INTEGER NOT NULL,
+                        guild_id INTEGER NOT NULL,
+                        level INTEGER DEFAULT 0,
+                        xp INTEGER DEFAULT 0,
+                        total_xp INTEGER DEFAULT 0,
+                        PRIMARY KEY (user_id, guild_id)
+                    )
+                """)
+                try:
+                    await writer.execute("ALTER TABLE users ADD COLUMN total_xp INTEGER DEFAULT 0")
+                    self.logger.info("DB'ye 'total_xp' sütunu eklendi.")
+                except sqlite3.OperationalError: # Sütun zaten varsa bu hata alınır, sorun değil.
+                    pass
+                # Liderlik tablosu için kapsayan (covering) indeks: sıralama ve seçilen tüm sütunlar indeksten okunur,
+                # (total_xp, user_id) imleciyle sayfalama da aynı sırayı kullanır. Sorgular sadece XP'si olan
+                # kullanıcılara baktığından kısmi indeks sıfır satırları içermez
+                async with writer.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ix_users_guild_xp'"
+                ) as cur:
+                    leaderboard_index_exists = await cur.fetchone() is not None
+                # Yerini kapsayan indeks aldı; fazladan her indeks her XP yazımında ayrıca güncellenirdi
+                await writer.execute("DROP INDEX IF EXISTS ix_users_guild_xp_uid")
+                await writer.execute("DROP INDEX IF EXISTS idx_guild_active_xp") # Kapsayan indeksin ön eki
+                await writer.execute("DROP INDEX IF EXISTS idx_total_xp") # Hiçbir sorgu "total_xp > 0" olmadan sıralamıyor
+                await writer.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_users_guild_xp ON users (guild_id, total_xp DESC, user_id DESC, level) WHERE total_xp > 0"
                 )
+                if not leaderboard_index_exists: # Sorgu planlayıcının yeni indeksi seçebilmesi için istatistikleri bir kez topla
+                    await writer.execute("ANALYZE")
+
+            # WAL modunda okuyucular yazıcıyı beklemez
+            db = await aiosqlite.connect(DB_NAME)
+            await db.executescript("""
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-64000;
             """)
-            try:
-                self.cursor.execute("ALTER TABLE users ADD COLUMN total_xp INTEGER DEFAULT 0")
-                self.logger.info("DB'ye 'total_xp' sütunu eklendi.")
-            except sqlite3.OperationalError: # Sütun zaten varsa bu hata alınır, sorun değil.
-                pass
-            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_total_xp ON users (guild_id, total_xp DESC)")
-            self.conn.commit()
-            self.logger.info(f"'{DB_NAME}' veritabanına bağlandı.")
+            self.db = db
+            self._writer = writer
+            self.logger.info(f"'{DB_NAME}' veritabanına bağlandı (WAL modu, ayrı yazıcı bağlantısı).")
         except Exception as e:
             self.logger.error(f"Veritabanı başlatma hatası: {e}")
-            self.conn = None
-            self.cursor = None
-
-    def _get_user_data(self, guild_id: int, user_id: int) -> Tuple[int, int, int]:
-        """Retrieve (level, xp, total_xp) for a user. Initialize if not found."""
-        if not self.conn or not self.cursor:
+            for conn in (db, writer):
+                if conn:
+                    await conn.close()
+            self.db = None
+            self._writer = None
+
+    @contextlib.asynccontextmanager
+    async def _transaction(self, conn: aiosqlite.Connection):
+        """Async counterpart of `with conn:` for an autocommit connection.
+
+        Everything in the block is committed once on exit, or rolled back on error.
+        """
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            yield conn
+        except BaseException:
+            # BEGIN beklenirken iptal gelse bile komut bağlantı thread'inde yine çalışır;
+            # ROLLBACK aynı sırada ondan sonra çalıştığı için açık işlem kalmaz
+            try:
+                await conn.execute("ROLLBACK")
+            except sqlite3.Error: # İşlem hiç başlamadıysa (ör. BEGIN kilit hatası verdiyse) geri alınacak bir şey yok
+                pass
+            raise
+        await conn.execute("COMMIT")
+
+    def _user_lock(self, guild_id: int, user_id: int) -> asyncio.Lock:
+        """Return the lock that serialises XP changes for one member."""
+        key = (guild_id, user_id)
+        lock = self._user_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[key] = lock
+        return lock
+
+    async def _get_user_data(self, guild_id: int, user_id: int) -> Tuple[int, int, int]:
+        """Retrieve (level, xp, total_xp) for a user. Users without a row have (0, 0, 0)."""
+        key = (guild_id, user_id)
+        pending = self._pending.get(key)
+        if pending is not None: # Henüz yazılmamış güncel veri bellekte
+            return pending
+        cached = self._user_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < USER_DATA_CACHE_TTL_SECONDS:
+            return cached[1]
+        if not self.db:
             self.logger.error("Veritabanı bağlantısı yok, kullanıcı verisi alınamıyor.")
             return (0, 0, 0)
         try:
-            self.cursor.execute(
-                "SELECT level, xp, total_xp FROM users WHERE user_id = ? AND guild_id = ?",
-                (user_id, guild_id)
-            )
-            result = self.cursor.fetchone()
+            async with self.db.execute(SQL_SELECT_USER, (user_id, guild_id)) as cur:
+                result = await cur.fetchone()
             if result and None not in result: # Veritabanından gelen değerlerin None olmadığını kontrol et
-                return (int(result[0]), int(result[1]), int(result[2]))
+                data = (int(result[0]), int(result[1]), int(result[2]))
             else:
-                # Kullanıcı bulunamadı veya veriler eksik, yeni kayıt oluştur veya sıfırla
-                self.logger.info(f"Kullanıcı DB'de bulunamadı/eksik, sıfırlanıyor (K:{user_id}, S:{guild_id})")
-                self.cursor.execute(
-                    "INSERT OR REPLACE INTO users (user_id, guild_id, level, xp, total_xp) VALUES (?, ?, 0, 0, 0)",
-                    (user_id, guild_id)
-                )
-                self.conn.commit()
-                return (0, 0, 0)
+                # Kullanıcı bulunamadı veya veriler eksik; satır ilk XP kazanımında UPSERT ile oluşturulur
+                self.logger.debug(f"Kullanıcı DB'de bulunamadı/eksik, sıfır kabul ediliyor (K:{user_id}, S:{guild_id})")
+                data = (0, 0, 0)
+            self._user_cache[key] = (time.monotonic(), data)
+            return data
         except sqlite3.Error as e:
             self.logger.error(f"Veri alma hatası (K:{user_id}, S:{guild_id}): {e}")
             return (0, 0, 0)
 
-    def _update_user_xp(self, guild_id: int, user_id: int, level: int, xp: int, total_xp: int):
-        """Update a user's level, xp, and total_xp in the database."""
-        if not self.conn or not self.cursor:
+    async def _update_user_xp(self, guild_id: int, user_id: int, level: int, xp: int, total_xp: int):
+        """Queue a user's level, xp, and total_xp update; written to the database in batches."""
+        if not self._writer:
             self.logger.error("Veritabanı bağlantısı yok, XP güncellenemiyor.")
             return
-        try:
-            self.cursor.execute(
-                "INSERT OR REPLACE INTO users (user_id, guild_id, level, xp, total_xp) VALUES (?, ?, ?, ?, ?)",
-                (user_id, guild_id, int(level), int(xp), int(total_xp))
-            )
-            self.conn.commit()
-            self.logger.debug(f"Kullanıcı XP güncellendi: K:{user_id}, S:{guild_id}, Seviye:{level}, XP:{xp}, Toplam XP:{total_xp}")
-        except sqlite3.Error as e:
-            self.logger.error(f"Veri güncelleme hatası (K:{user_id}, S:{guild_id}): {e}")
+        data = (int(level), int(xp), int(total_xp))
+        self._pending[(guild_id, user_id)] = data
+        self._user_cache[(guild_id, user_id)] = (time.monotonic(), data) # Yazıldıktan sonra da önbellek güncel kalsın
+        self.logger.debug(f"Kullanıcı XP güncellemesi sıraya alındı: K:{user_id}, S:{guild_id}, Seviye:{level}, XP:{xp}, Toplam XP:{total_xp}")
+        if len(self._pending) >= XP_FLUSH_BATCH_SIZE and (self._flush_task is None or self._flush_task.done()):
+            # Mesaj işleyicisi diskin yazılmasını beklemez; yazma arka planda yapılır
+            self._flush_task = self.bot.loop.create_task(self._flush_pending_xp())
+
+    async def _write_users(self, rows: List[Tuple[int, int, int, int, int]]):
+        """UPSERT (user_id, guild_id, level, xp, total_xp) rows through the writer connection.
+
+        Rows are committed in BEGIN IMMEDIATE ... COMMIT transactions of at most
+        XP_WRITE_TRANSACTION_SIZE rows. The caller must hold _write_lock.
+        """
+        for i in range(0, len(rows), XP_WRITE_TRANSACTION_SIZE):
+            async with self._transaction(self._writer):
+                await self._writer.executemany(SQL_UPSERT_USER, rows[i:i + XP_WRITE_TRANSACTION_SIZE])
+
+    async def _flush_pending_xp(self) -> bool:
+        """Write all queued XP updates to the database in batched transactions.
+
+        Returns False if the write failed; the updates then stay queued for the next flush.
+        """
+        if not self._pending:
+            return True
+        if not self._writer:
+            return False
+        async with self._write_lock:
+            # Anlık görüntü kilit içinde alınır ki eski bir görüntü daha yeni bir yazmanın üzerine yazılmasın
+            batch = list(self._pending.items())
+            if not batch:
+                return True
+            try:
+                await self._write_users(
+                    [(user_id, guild_id, level, xp, total_xp) for (guild_id, user_id), (level, xp, total_xp) in batch]
+                )
+            except sqlite3.Error as e:
+                self.logger.error(f"Toplu XP yazma hatası ({len(batch)} kayıt): {e}")
+                return False
+        # Yazma sırasında tekrar güncellenen kayıtlar bir sonraki turda yazılmak üzere kalır
+        for key, value in batch:
+            if self._pending.get(key) == value:
+                del self._pending[key]
+        self.logger.debug(f"{len(batch)} XP güncellemesi veritabanına yazıldı.")
+        return True
+
+    def _snapshot_user(
+        self, guild_id: int, user_id: int
+    ) -> Tuple[Optional[Tuple[int, int, int]], Optional[Tuple[float, Tuple[int, int, int]]]]:
+        """Return the user's (pending, cached) entries so a failed admin write can be undone."""
+        key = (guild_id, user_id)
+        return self._pending.get(key), self._user_cache.get(key)
+
+    def _restore_users(self, guild_id: int, snapshots: Dict[int, tuple]):
+        """Put back the pending/cached entries saved by _snapshot_user after a write failed.
+
+        Message XP that was still queued before the admin change is kept, not dropped.
+        """
+        for user_id, (pending, cached) in snapshots.items():
+            key = (guild_id, user_id)
+            if pending is None:
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = pending
+            if cached is None:
+                self._user_cache.pop(key, None)
+            else:
+                self._user_cache[key] = cached
+
+    @tasks.loop(seconds=XP_FLUSH_INTERVAL_SECONDS)
+    async def _flush_xp(self):
+        """Periodically flush queued XP updates."""
+        await self._flush_pending_xp()
+
+    @tasks.loop(seconds=RANK_THRESHOLD_REFRESH_SECONDS)
+    async def _refresh_threshold_xp(self):
+        """Cache the total_xp of the user at rank `rank_removal_threshold` for each guild."""
+        if self.rank_removal_threshold is None or not self.db:
+            self._threshold_xp.clear()
+            return
+        for guild in self.bot.guilds:
+            try:
+                async with self.db.execute(
+                    SQL_RANK_THRESHOLD_XP,
+                    (guild.id, self.rank_removal_threshold - 1)
+                ) as cur:
+                    result = await cur.fetchone()
+            except sqlite3.Error as e:
+                self.logger.error(f"Sıralama eşiği alınamadı (S:{guild.id}): {e}")
+                continue
+            if result and result[0]:
+                self._threshold_xp[guild.id] = int(result[0])
+            else: # Eşik kadar sıralanan kullanıcı yoksa kimse eşiğin altında değildir
+                self._threshold_xp.pop(guild.id, None)
+
+    @_refresh_threshold_xp.before_loop
+    async def _before_refresh_threshold_xp(self):
+        await self.bot.wait_until_ready()
+        await self._db_init_task
 
     # --- Utility Functions ---
     def _calculate_xp_for_level(self, level: int) -> int:
@@ -177,51 +521,54 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             return 0 # Negatif seviyeler için XP ihtiyacı 0 olsun.
         return 5 * (level ** 2) + (50 * level) + 100
 
-    def _get_user_rank(self, guild_id: int, user_id: int) -> int:
-        """Get the user's rank in the guild based on total_xp."""
-        if not self.conn or not self.cursor:
+    async def _get_user_rank(self, guild_id: int, user_id: int, total_xp: Optional[int] = None) -> int:
+        """Get the user's rank in the guild based on total_xp.
+
+        If the caller already knows the user's total_xp it can pass it to skip the lookup.
+        """
+        if not self.db:
             self.logger.error("Veritabanı bağlantısı yok, sıralama alınamıyor.")
             return 0
+        if total_xp is None:
+            _, _, total_xp = await self._get_user_data(guild_id, user_id)
+        if total_xp <= 0:
+            return 0 # Hiç XP'si olmayan kullanıcı sıralamada yer almaz
         try:
-            self.cursor.execute(
-                "SELECT user_id FROM users WHERE guild_id = ? AND total_xp > 0 ORDER BY total_xp DESC",
-                (guild_id,)
-            )
-            results = self.cursor.fetchall()
-            for rank, (uid,) in enumerate(results, start=1):
-                if uid == user_id:
-                    return rank
-            return 0 # Kullanıcı listede yoksa (örneğin hiç XP'si yoksa)
+            async with self.db.execute(SQL_USER_RANK, (guild_id, total_xp)) as cur:
+                result = await cur.fetchone()
+            return int(result[0]) if result else 0
         except sqlite3.Error as e:
             self.logger.error(f"Sıralama alma hatası (S:{guild_id}): {e}")
             return 0
 
+    def _cumulative_xp_for_level(self, level: int) -> int:
+        """Total XP required to reach a level from level 0.
+
+        Sum of 5k^2 + 50k + 100 for k in [0, level), i.e. (10L^3 + 135L^2 + 455L) / 6.
+        """
+        return (10 * level ** 3 + 135 * level ** 2 + 455 * level) // 6
+
     def _recalculate_level(self, total_xp: int) -> Tuple[int, int]:
         """Recalculate level and current XP based on total XP."""
-        level = 0
-        xp_cumulative = 0
-        xp_needed_for_next = self._calculate_xp_for_level(level)
-        while xp_cumulative + xp_needed_for_next <= total_xp:
-            xp_cumulative += xp_needed_for_next
+        if total_xp <= 0:
+            return 0, 0
+        # S(L) ~ (5/3)(L + 4.5)^3, bu yüzden tahmin gerçek seviyeye çok yakındır; ardından tam sayıyla düzeltilir
+        level = max(0, int((0.6 * total_xp) ** (1 / 3) - 4.5))
+        while level > 0 and self._cumulative_xp_for_level(level) > total_xp:
+            level -= 1
+        while self._cumulative_xp_for_level(level + 1) <= total_xp:
             level += 1
-            xp_needed_for_next = self._calculate_xp_for_level(level)
-        xp_in_level = total_xp - xp_cumulative
-        return level, xp_in_level
+        return level, total_xp - self._cumulative_xp_for_level(level)
 
     def _get_xp_boost(self, member: discord.Member) -> float:
         """Calculate the XP boost multiplier for a member."""
-        if "xp_boosts" not in self.config:
+        boosts = self._boosts
+        if not boosts:
             return 1.0
-        boost = 1.0
-        boosts = self.config["xp_boosts"]
-        user_boost = boosts.get(str(member.id)) # ID'ler string olarak saklanmış olabilir
-        if user_boost:
-            boost = max(boost, float(user_boost))
-        for role in member.roles:
-            role_boost = boosts.get(str(role.id)) # ID'ler string olarak saklanmış olabilir
-            if role_boost:
-                boost = max(boost, float(role_boost))
-        return boost
+        # Üyenin kendi ID'si ve rollerinden çarpanı tanımlı olanlar tek bir küme kesişimiyle bulunur
+        target_ids = {role.id for role in member.roles}
+        target_ids.add(member.id)
+        return max([1.0, *(boosts[target_id] for target_id in target_ids & boosts.keys())])
 
     # --- Role Management ---
     async def _update_level_roles(self, member: discord.Member, guild: discord.Guild, new_level: int):
@@ -236,11 +583,11 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             self.logger.warning("Yapılandırmada 'level_roles' bulunamadı.")
             return
 
-        level_roles_map = self.config["level_roles"]
-        self.logger.info(f"Level roles map: {level_roles_map}")
+        # Kullanıcının sahip olduğu seviye rolleri (tek bir küme kesişimi ile)
+        current_level_role_ids = {role.id for role in member.roles} & self._all_level_role_ids
 
-        level_str = str(new_level) # Seviyeler config'de string key olarak tutuluyor
-        if level_str not in level_roles_map:
+        role_to_add_id = self._level_role_ids.get(new_level)
+        if role_to_add_id is None:
             self.logger.info(f"Seviye {new_level} için rol tanımlı değil.")
             # Eğer önceki rolleri kaldırma aktifse ve bu seviye için rol yoksa,
             # yine de önceki seviye rollerini kaldırmayı düşünebiliriz.
@@ -249,16 +596,10 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             if self.config.get("remove_previous_roles", True):
                  # Sadece mevcut seviye için rol tanımlı değilse ama önceki roller kaldırılmalıysa
                 roles_to_remove_if_no_new_role = []
-                current_role_ids = {role.id for role in member.roles}
-                for lvl, role_id_str_iter in level_roles_map.items():
-                    try:
-                        role_id_int_iter = int(role_id_str_iter)
-                        if role_id_int_iter in current_role_ids:
-                            role_to_remove_obj = guild.get_role(role_id_int_iter)
-                            if role_to_remove_obj and role_to_remove_obj.position < bot_member.top_role.position:
-                                roles_to_remove_if_no_new_role.append(role_to_remove_obj)
-                    except ValueError:
-                        continue # Geçersiz rol ID'sini atla
+                for role_id_int_iter in current_level_role_ids:
+                    role_to_remove_obj = guild.get_role(role_id_int_iter)
+                    if role_to_remove_obj and role_to_remove_obj.position < bot_member.top_role.position:
+                        roles_to_remove_if_no_new_role.append(role_to_remove_obj)
                 if roles_to_remove_if_no_new_role:
                     try:
                         await member.remove_roles(*roles_to_remove_if_no_new_role, reason="Yeni seviye için rol tanımlı değil, eskiler kaldırıldı.")
@@ -269,12 +610,9 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
                         self.logger.error(f"Rol kaldırılırken hata (yeni seviye için rol yok): {e}")
             return
 
-
-        role_id_to_add_str = level_roles_map[level_str]
-        self.logger.info(f"Seviye {new_level} için rol ID: {role_id_to_add_str}")
+        self.logger.info(f"Seviye {new_level} için rol ID: {role_to_add_id}")
 
         try:
-            role_to_add_id = int(role_id_to_add_str)
             role_to_add = guild.get_role(role_to_add_id)
             if not role_to_add:
                 self.logger.error(f"Seviye {new_level} rol ID({role_to_add_id}) bulunamadı!")
@@ -289,32 +627,24 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
 
             roles_to_remove = []
             if self.config.get("remove_previous_roles", True):
-                current_role_ids = {role.id for role in member.roles}
-                self.logger.info(f"Kullanıcının mevcut rolleri: {current_role_ids}")
-                for lvl, role_id_str_iter in level_roles_map.items(): # level_roles_map'teki tüm tanımlı rolleri kontrol et
-                    try:
-                        lvl_int = int(lvl)
-                        role_id_int_iter = int(role_id_str_iter)
-                        # Sadece farklı seviyelerin rollerini ve eklenecek rol olmayanları kaldır
-                        if lvl_int != new_level and role_id_int_iter in current_role_ids and role_id_int_iter != role_to_add_id:
-                            role_to_remove_obj = guild.get_role(role_id_int_iter)
-                            if role_to_remove_obj:
-                                if role_to_remove_obj.position >= bot_member.top_role.position:
-                                    self.logger.warning(
-                                        f"Rol {role_to_remove_obj.name} (ID: {role_id_int_iter}) botun en yüksek rolünden yüksek, kaldırılamaz!"
-                                    )
-                                    continue
-                                roles_to_remove.append(role_to_remove_obj)
-                                self.logger.info(f"Kaldırılacak rol: {role_to_remove_obj.name} (ID: {role_id_int_iter})")
-                    except ValueError:
-                        self.logger.error(f"Geçersiz seviye veya rol ID: Seviye {lvl}, Rol ID {role_id_str_iter}")
-                        continue
+                self.logger.info(f"Kullanıcının mevcut seviye rolleri: {current_level_role_ids}")
+                # Sadece farklı seviyelerin rollerini ve eklenecek rol olmayanları kaldır
+                for role_id_int_iter in current_level_role_ids - {role_to_add_id}:
+                    role_to_remove_obj = guild.get_role(role_id_int_iter)
+                    if role_to_remove_obj:
+                        if role_to_remove_obj.position >= bot_member.top_role.position:
+                            self.logger.warning(
+                                f"Rol {role_to_remove_obj.name} (ID: {role_id_int_iter}) botun en yüksek rolünden yüksek, kaldırılamaz!"
+                            )
+                            continue
+                        roles_to_remove.append(role_to_remove_obj)
+                        self.logger.info(f"Kaldırılacak rol: {role_to_remove_obj.name} (ID: {role_id_int_iter}, Seviye: {self._role_id_to_level[role_id_int_iter]})")
 
             try:
                 if roles_to_remove:
                     self.logger.info(f"Roller kaldırılıyor: {[role.name for role in roles_to_remove]}")
                     await member.remove_roles(*roles_to_remove, reason=f"{new_level}. seviye rolü için eskiler kaldırıldı")
-                if role_to_add not in member.roles:
+                if role_to_add_id not in current_level_role_ids:
                     self.logger.info(f"Rol ekleniyor: {role_to_add.name} (ID: {role_to_add.id})")
                     await member.add_roles(role_to_add, reason=f"Seviye {new_level} ulaştı")
                 else:
@@ -324,8 +654,6 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             except Exception as e:
                 self.logger.error(f"Rol güncellenirken hata: {e}")
 
-        except ValueError:
-            self.logger.error(f"Seviye {new_level} için rol ID('{role_id_to_add_str}') sayı değil.")
         except Exception as e:
             self.logger.error(f"_update_level_roles içinde beklenmedik hata: {e}")
 
@@ -337,30 +665,25 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             self.logger.warning("Yapılandırmada 'level_roles' bulunamadı.")
             return
 
-        level_role_map = self.config["level_roles"]
+        # Tek geçişte üyenin seviye rollerini topla (önceden hesaplanmış küme ile O(1) kontrol)
+        bot_top_role = guild.me.top_role
         roles_to_remove = []
-        member_role_ids = {role.id for role in member.roles}
-        bot_member = guild.me
-
-        for role_id_str in level_role_map.values(): # Sadece config'de tanımlı seviye rollerini kontrol et
-            try:
-                role_id_int = int(role_id_str)
-                if role_id_int in member_role_ids:
-                    role_obj = guild.get_role(role_id_int)
-                    if role_obj:
-                        if role_obj.position >= bot_member.top_role.position: # Düzeltildi: LIFECYCLE kaldırıldı
-                            self.logger.warning(
-                                f"Rol {role_obj.name} (ID: {role_id_int}) botun en yüksek rolünden yüksek, kaldırılamaz!"
-                            )
-                            continue
-                        roles_to_remove.append(role_obj)
-            except ValueError:
-                self.logger.error(f"Kaldırma için JSON'daki ID('{role_id_str}') geçersiz.")
+        for role_obj in member.roles:
+            if role_obj.id not in self._all_level_role_ids:
                 continue
+            if role_obj.position >= bot_top_role.position:
+                self.logger.warning(
+                    f"Rol {role_obj.name} (ID: {role_obj.id}) botun en yüksek rolünden yüksek, kaldırılamaz!"
+                )
+                continue
+            roles_to_remove.append(role_obj)
 
         if roles_to_remove:
             try:
-                await member.remove_roles(*roles_to_remove, reason="Seviye sıfırlandı veya sıralama düştü veya rol düzeltmesi")
+                # atomic=False: roller tek tek değil, tek bir üye güncellemesi (PATCH) ile kaldırılır
+                await member.remove_roles(
+                    *roles_to_remove, atomic=False, reason="Seviye sıfırlandı veya sıralama düştü veya rol düzeltmesi"
+                )
                 self.logger.info(f"{member.display_name}'dan roller kaldırıldı: {[r.name for r in roles_to_remove]}")
             except discord.Forbidden:
                 self.logger.error(f"{member.display_name} rolleri kaldırıLAMADI ('Rolleri Yönet' izni eksik veya rol hiyerarşisi sorunu?)")
@@ -371,6 +694,7 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
     async def _correct_level_roles_on_startup(self):
         """Correct level roles for all members when the bot starts."""
         await self.bot.wait_until_ready()
+        await self._db_init_task
         self.logger.info("Bot başlatıldı, seviye rolleri düzeltme işlemi başlıyor.")
         for guild in self.bot.guilds:
             self.logger.info(f"Sunucu: {guild.name} (ID: {guild.id}) için roller kontrol ediliyor.")
@@ -379,82 +703,187 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
                 self.logger.error(f"{guild.name} sunucusunda 'Rolleri Yönet' izni yok, düzeltme yapılamaz!")
                 continue
 
-            # Üyeleri toplu çekmek yerine iterasyonla almak daha güvenli olabilir
-            # özellikle çok büyük sunucularda hafıza sorunlarını önlemek için.
-            # fetch_members limit=None potansiyel olarak çok fazla veri çekebilir.
-            # Ancak mevcut kodunuzda bu şekilde bırakıyorum.
-            async for member in guild.fetch_members(limit=None):
-                if member.bot:
-                    continue
-                await self._correct_member_level_roles(member, guild)
-                await asyncio.sleep(0.1)  # Rate limit prevention
+            # Üyeler members intent'i ile önbellekte tutulur; REST üzerinden tek tek çekmek yerine önbellek kullanılır
+            if not guild.chunked:
+                await guild.chunk()
+            members = [member for member in guild.members if not member.bot]
+            levels = await self._get_guild_levels(guild.id, [member.id for member in members])
+
+            # Rolleri zaten doğru olanlar için görev bile oluşturulmaz
+            to_correct = [
+                (member, levels.get(member.id, 0)) for member in members
+                if not self._level_roles_match(member, levels.get(member.id, 0))
+            ]
+
+            # Rate limit'ler discord.py tarafından yönetilir; sabit bekleme yerine eşzamanlılık sınırlanır
+            semaphore = asyncio.Semaphore(ROLE_CORRECTION_CONCURRENCY)
+
+            async def _run(member: discord.Member, level: int):
+                async with semaphore:
+                    await self._correct_member_level_roles(member, guild, level)
+
+            await asyncio.gather(*(_run(member, level) for member, level in to_correct))
+            self.logger.info(f"{guild.name}: {len(members)} üyeden {len(to_correct)} tanesinin rolleri düzeltildi.")
         self.logger.info("Seviye rolleri düzeltme işlemi tamamlandı.")
 
-    async def _correct_member_level_roles(self, member: discord.Member, guild: discord.Guild):
-        """Correct level roles for a single member."""
+    async def _get_guild_levels(self, guild_id: int, user_ids: List[int]) -> Dict[int, int]:
+        """Fetch the levels of many users in a guild with chunked IN queries."""
+        levels: Dict[int, int] = {}
+        if not self.db:
+            self.logger.error("Veritabanı bağlantısı yok, seviyeler alınamıyor.")
+            return levels
+        try:
+            for i in range(0, len(user_ids), SQL_IN_CHUNK_SIZE):
+                chunk = user_ids[i:i + SQL_IN_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                async with self.db.execute(
+                    f"SELECT user_id, level FROM users WHERE guild_id = ? AND user_id IN ({placeholders})",
+                    (guild_id, *chunk)
+                ) as cur:
+                    for user_id, level in await cur.fetchall():
+                        levels[user_id] = int(level or 0)
+        except sqlite3.Error as e:
+            self.logger.error(f"Toplu seviye alma hatası (S:{guild_id}): {e}")
+        # Henüz yazılmamış güncellemeler DB'deki değerden daha yenidir
+        for (pending_guild_id, user_id), (level, _, _) in self._pending.items():
+            if pending_guild_id == guild_id:
+                levels[user_id] = level
+        return levels
+
+    def _level_roles_match(self, member: discord.Member, level: int) -> bool:
+        """Whether the member holds exactly the level role expected for the level (or none)."""
+        expected_role_id = self._level_role_ids.get(level)
+        expected = {expected_role_id} if expected_role_id is not None else set()
+        return {role.id for role in member.roles} & self._all_level_role_ids == expected
+
+    async def _correct_member_level_roles(self, member: discord.Member, guild: discord.Guild, level: Optional[int] = None):
+        """Correct level roles for a single member. The level is looked up if not given."""
+        if level is None:
+            level, _, _ = await self._get_user_data(guild.id, member.id)
+        if self._level_roles_match(member, level): # Çoğu üye için hiçbir işlem gerekmez
+            return
         self.logger.info(f"Rol düzeltme: {member.display_name} (ID: {member.id})")
-        level, _, _ = self._get_user_data(guild.id, member.id)
-        level_roles_map = self.config.get("level_roles", {})
-        level_str = str(level) # Seviyeler config'de string key olarak tutuluyor
+        role_id = self._level_role_ids.get(level)
         bot_member = guild.me
 
-        # Önce TÜM tanımlı seviye rollerini kaldır
-        # Bu, kullanıcının sahip olmaması gereken eski seviye rollerini temizler.
-        await self._remove_all_level_roles(member, guild)
-
-        # Sonra doğru seviye rolünü ekle (eğer varsa)
-        if level_str in level_roles_map:
-            try:
-                role_id = int(level_roles_map[level_str])
-                role = guild.get_role(role_id)
-                if not role:
-                    self.logger.error(f"Seviye {level} için rol ID({role_id}) bulunamadı!")
-                    return
-                if role.position >= bot_member.top_role.position:
-                    self.logger.error(
-                        f"Rol {role.name} (ID: {role_id}) botun en yüksek rolünden yüksek, atanamaz!"
-                    )
-                    return
-
-                if role not in member.roles: # Zaten sahip değilse ekle
-                    await member.add_roles(role, reason=f"Seviye {level} düzeltmesi")
-                    self.logger.info(f"{member.display_name} için rol atandı: {role.name} (ID: {role_id})")
-                else:
-                    self.logger.info(f"{member.display_name} zaten {role.name} rolüne sahip (düzeltme sonrası).")
-            except ValueError:
-                self.logger.error(f"Seviye {level} için geçersiz rol ID: {level_roles_map[level_str]}")
-            except discord.Forbidden:
-                self.logger.error(f"{member.display_name} için rol atanamadı ('Rolleri Yönet' izni eksik?)")
-            except Exception as e:
-                self.logger.error(f"Rol düzeltme hatası (_correct_member_level_roles): {e}")
+        # Hedef rol listesi hesaplanır ve tek bir member.edit çağrısıyla uygulanır (kaldır + ekle yerine tek PATCH)
+        role_to_add = None
+        if role_id is not None:
+            role_to_add = guild.get_role(role_id)
+            if not role_to_add:
+                self.logger.error(f"Seviye {level} için rol ID({role_id}) bulunamadı!")
+            elif role_to_add.position >= bot_member.top_role.position:
+                self.logger.error(
+                    f"Rol {role_to_add.name} (ID: {role_id}) botun en yüksek rolünden yüksek, atanamaz!"
+                )
+                role_to_add = None
         else:
             self.logger.info(f"{member.display_name} (Seviye {level}) için atanacak rol bulunamadı (düzeltme).")
 
+        new_roles = []
+        for role in member.roles:
+            if role.is_default():
+                continue
+            # Yanlış seviye rolleri kaldırılır; botun üstündeki roller değiştirilemeyeceği için korunur
+            if role.id in self._all_level_role_ids and role != role_to_add:
+                if role.position < bot_member.top_role.position:
+                    continue
+                self.logger.warning(f"Rol {role.name} (ID: {role.id}) botun en yüksek rolünden yüksek, kaldırılamaz!")
+            new_roles.append(role)
+        if role_to_add and role_to_add not in new_roles:
+            new_roles.append(role_to_add)
+
+        if set(new_roles) == {role for role in member.roles if not role.is_default()}:
+            self.logger.info(f"{member.display_name} için seviye rolleri zaten doğru (düzeltme).")
+            return
+
+        try:
+            await member.edit(roles=new_roles, reason=f"Seviye {level} düzeltmesi")
+            self.logger.info(f"{member.display_name} için seviye rolleri düzeltildi: {[r.name for r in new_roles]}")
+        except discord.Forbidden:
+            self.logger.error(f"{member.display_name} için rol atanamadı ('Rolleri Yönet' izni eksik?)")
+        except Exception as e:
+            self.logger.error(f"Rol düzeltme hatası (_correct_member_level_roles): {e}")
+
 
     # --- XP Management ---
     async def _grant_xp(self, member: discord.Member, guild: discord.Guild, xp_change: int) -> Tuple[bool, int, int]:
         """Grant or remove XP, update levels and roles."""
-        if not self.conn or not self.cursor:
+        if not self.db:
             self.logger.error("Veritabanı bağlantısı yok, XP güncellenemiyor.")
             return (False, 0, 0) # (leveled_up, new_level, old_level)
 
         guild_id = guild.id
         user_id = member.id
-        old_level, old_xp, old_total_xp = self._get_user_data(guild_id, user_id)
-        self.logger.info(f"Eski durum: {member.display_name} | Seviye: {old_level}, XP: {old_xp}, Toplam XP: {old_total_xp}")
+        async with self._user_lock(guild_id, user_id): # Okuma ile yazma arasında başka bir değişiklik araya girmesin
+            old_level, old_xp, old_total_xp = await self._get_user_data(guild_id, user_id)
+            self.logger.info(f"Eski durum: {member.display_name} | Seviye: {old_level}, XP: {old_xp}, Toplam XP: {old_total_xp}")
 
-        new_total_xp = max(0, old_total_xp + xp_change) # XP'nin 0'ın altına düşmemesini sağla
-        new_level, new_xp = self._recalculate_level(new_total_xp)
+            new_total_xp = max(0, old_total_xp + xp_change) # XP'nin 0'ın altına düşmemesini sağla
+            new_level, new_xp = self._recalculate_level(new_total_xp)
 
-        leveled_up = new_level > old_level
-        de_leveled = new_level < old_level
+            if (old_total_xp > 0) != (new_total_xp > 0): # Sıralanan üye sayısı değişti
+                self._lb_count_cache.pop(guild_id, None)
 
-        self._update_user_xp(guild_id, user_id, new_level, new_xp, new_total_xp)
+            await self._update_user_xp(guild_id, user_id, new_level, new_xp, new_total_xp)
         self.logger.info(
             f"XP Değişimi: {member.display_name} | Değişim: {xp_change:+d} | "
             f"Yeni Toplam XP: {new_total_xp} | Seviye: {old_level} -> {new_level}" # Düzeltildi: "Yeni0>" kaldırıldı
         )
 
+        await self._sync_level_roles(member, guild, old_level, new_level, new_total_xp)
+        return new_level > old_level, new_level, old_level
+
+    async def _grant_xp_bulk(
+        self, members: List[discord.Member], guild: discord.Guild, xp_change: int
+    ) -> List[Tuple[discord.Member, int, int]]:
+        """Grant or remove the same XP for several members, committing all rows in one transaction.
+
+        Returns (member, new_level, old_level) for every member, or an empty list if nothing was written.
+        """
+        if not self._writer:
+            self.logger.error("Veritabanı bağlantısı yok, XP güncellenemiyor.")
+            return []
+
+        guild_id = guild.id
+        changes = []
+        snapshots = {}
+        async with contextlib.AsyncExitStack() as stack:
+            # Üye kilitleri yazma (ve gerekirse geri alma) bitene kadar tutulur; kilitlenme olmasın diye
+            # her zaman aynı (ID) sırada alınır
+            for user_id in sorted({member.id for member in members}):
+                await stack.enter_async_context(self._user_lock(guild_id, user_id))
+            for member in members:
+                old_level, _, old_total_xp = await self._get_user_data(guild_id, member.id)
+                snapshots[member.id] = self._snapshot_user(guild_id, member.id)
+                new_total_xp = max(0, old_total_xp + xp_change)
+                new_level, new_xp = self._recalculate_level(new_total_xp)
+                if (old_total_xp > 0) != (new_total_xp > 0):
+                    self._lb_count_cache.pop(guild_id, None)
+                await self._update_user_xp(guild_id, member.id, new_level, new_xp, new_total_xp)
+                changes.append((member, old_level, new_level, new_total_xp))
+            # Tüm satırlar bekleyen güncellemelerle birlikte tek bir BEGIN IMMEDIATE ... COMMIT ile yazılır
+            if not await self._flush_pending_xp():
+                # Admin değişikliği yazılamadıysa geri alınır; çağıran komut hatayı bildirir, roller değiştirilmez
+                self._restore_users(guild_id, snapshots)
+                self._lb_count_cache.pop(guild_id, None)
+                self.logger.error(f"Toplu XP değişimi yazılamadı, geri alındı: {len(changes)} üye (S:{guild_id})")
+                return []
+        self.logger.info(f"Toplu XP değişimi: {len(changes)} üye | Değişim: {xp_change:+d} (S:{guild_id})")
+
+        # Rol senkronizasyonu yazma işleminden sonra, üye başına bir kez
+        for member, old_level, new_level, new_total_xp in changes:
+            await self._sync_level_roles(member, guild, old_level, new_level, new_total_xp)
+        return [(member, new_level, old_level) for member, old_level, new_level, _ in changes]
+
+    async def _sync_level_roles(
+        self, member: discord.Member, guild: discord.Guild, old_level: int, new_level: int, new_total_xp: int
+    ):
+        """Apply level-role changes after a member's XP changed."""
+        leveled_up = new_level > old_level
+        de_leveled = new_level < old_level
+        guild_id = guild.id
+
         if leveled_up:
             self.logger.info(f"Seviye atlandı: {old_level} -> {new_level}, rol güncelleme çağrılıyor.")
             await self._update_level_roles(member, guild, new_level)
@@ -466,60 +895,54 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
 
 
         # Sıralama kontrolü ile rol kaldırma
-        if self.rank_removal_threshold is not None:
-            current_rank = self._get_user_rank(guild_id, user_id)
-            if current_rank > 0 and current_rank > self.rank_removal_threshold:
-                self.logger.info(f"Kullanıcı sıralaması ({current_rank}) eşiği geçti ({self.rank_removal_threshold}), tüm seviye rolleri kaldırılıyor.")
+        # Sıra > eşik  <=>  eşik sıradaki kullanıcıdan daha az toplam XP (önbellekteki değerle karşılaştırılır)
+        threshold_xp = self._threshold_xp.get(guild_id)
+        if self.rank_removal_threshold is not None and threshold_xp is not None:
+            if 0 < new_total_xp < threshold_xp:
+                self.logger.info(f"Kullanıcı toplam XP'si ({new_total_xp}) {self.rank_removal_threshold}. sıranın XP'sinin ({threshold_xp}) altında, tüm seviye rolleri kaldırılıyor.")
                 await self._remove_all_level_roles(member, guild) # Bu, mevcut seviye rolünü de kaldırır.
 
-        return leveled_up, new_level, old_level
-
     # --- Event Listeners ---
+    async def _resolve_prefixes(self, message: discord.Message) -> Tuple[str, ...]:
+        """Resolve the command prefixes for the message's guild and cache them."""
+        command_prefix = self.bot.command_prefix
+        if isinstance(command_prefix, str):
+            prefixes = (command_prefix,)
+        elif isinstance(command_prefix, (list, tuple)):
+            prefixes = tuple(command_prefix)
+        else: # Çağrılabilir prefix ise get_prefix sadece önbellek boşken çağrılır
+            prefix = await self.bot.get_prefix(message)
+            prefixes = (prefix,) if isinstance(prefix, str) else tuple(prefix)
+        self._prefix_cache[message.guild.id] = prefixes
+        return prefixes
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         """Grant XP when a user sends a message."""
         if message.author.bot or not message.guild:
             return
 
-        if message.channel.id in self.config.get("blacklisted_channels", []):
+        if message.channel.id in self._blacklist:
             self.logger.debug(f"Kanal {message.channel.id} ({message.channel.name}) engelli, XP verilmeyecek.")
             return
 
-        # Bot prefix'ini dinamik olarak al
-        # Bu satırın çalışması için bot objesinin config'inde PREFIX anahtarı olmalı.
-        # Eğer bot.command_prefix kullanılıyorsa, ona göre düzenlenmeli.
-        # Varsayılan olarak '!' kullanıyorum, eğer bot.config yoksa.
-        try:
-            prefix = self.bot.config.get("PREFIX", "!") # Veya bot.command_prefix
-        except AttributeError: # Eğer self.bot.config yoksa
-             prefix = await self.bot.get_prefix(message)
-             if isinstance(prefix, list): # Birden fazla prefix varsa ilkini al
-                 prefix = prefix[0]
-
-
-        if message.content.startswith(prefix):
+        # Prefix'ler sunucu başına bir kez çözülüp önbelleğe alınır; tuple ile tüm prefix'ler tek çağrıda kontrol edilir
+        prefixes = self._prefix_cache.get(message.guild.id) or await self._resolve_prefixes(message)
+        if message.content.startswith(prefixes):
             return
 
-        guild_id = message.guild.id
-        user_id = message.author.id
+        cooldown_key = (message.guild.id, message.author.id)
         current_time = time.time()
-
-        if guild_id not in self.user_message_cooldowns:
-            self.user_message_cooldowns[guild_id] = {}
-
-        last_message_time = self.user_message_cooldowns[guild_id].get(user_id, 0)
         cooldown = self.config.get("xp_cooldown_seconds", 60)
 
-        if current_time - last_message_time < cooldown:
+        if current_time - self._last_msg.get(cooldown_key, 0.0) < cooldown:
             return
 
-        self.user_message_cooldowns[guild_id][user_id] = current_time
-        xp_range = self.config.get("xp_range", {"min": 15, "max": 25})
-        base_xp = random.randint(xp_range["min"], xp_range["max"])
+        self._last_msg[cooldown_key] = current_time
         boost = self._get_xp_boost(message.author)
-        xp_to_add = int(base_xp * boost)
+        xp_to_add = self._xp_draw[boost]()
 
-        self.logger.debug(f"XP veriliyor: {message.author.display_name}, Temel XP: {base_xp}, Çarpan: x{boost:.2f}, Toplam XP: {xp_to_add}")
+        self.logger.debug(f"XP veriliyor: {message.author.display_name}, Çarpan: x{boost:.2f}, Toplam XP: {xp_to_add}")
         leveled_up, new_level, old_level = await self._grant_xp(message.author, message.guild, xp_to_add)
 
         if leveled_up:
@@ -532,6 +955,30 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             except Exception as e:
                 self.logger.error(f"Seviye atlama mesajı hatası: {e}")
 
+    @commands.Cog.listener()
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        """Drop the cached leaderboard embed when the guild is renamed."""
+        if before.name != after.name:
+            self._lb_template.pop(after.id, None)
+
+    @tasks.loop(seconds=COOLDOWN_PRUNE_INTERVAL_SECONDS)
+    async def _prune_cooldowns(self):
+        """Drop long-expired cooldown, user cache and leaderboard cursor entries so the dicts do not grow forever."""
+        cutoff = time.time() - 2 * self.config.get("xp_cooldown_seconds", 60)
+        expired = [key for key, last_time in self._last_msg.items() if last_time < cutoff]
+        for key in expired:
+            del self._last_msg[key]
+        if expired:
+            self.logger.debug(f"{len(expired)} süresi dolmuş XP bekleme kaydı temizlendi.")
+
+        cache_cutoff = time.monotonic() - USER_DATA_CACHE_TTL_SECONDS
+        for key in [key for key, (read_time, _) in self._user_cache.items() if read_time < cache_cutoff]:
+            del self._user_cache[key]
+
+        cursor_cutoff = time.monotonic() - LB_CURSOR_TTL_SECONDS
+        for key in [key for key, (created, _) in self._lb_cursors.items() if created < cursor_cutoff]:
+            del self._lb_cursors[key]
+
     # --- User Commands ---
     @commands.command(name="seviye")
     @commands.cooldown(1, 5, commands.BucketType.user)
@@ -540,7 +987,7 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         if not ctx.guild:
             await ctx.send("Bu komut sadece sunucularda kullanılabilir.")
             return
-        if not self.conn: # Veritabanı bağlantısını kontrol et
+        if not self.db: # Veritabanı bağlantısını kontrol et
             await ctx.send("Veritabanı hatası nedeniyle seviye bilgisi alınamıyor. Lütfen daha sonra tekrar deneyin.")
             self.logger.error("rank_command: Veritabanı bağlantısı yok.")
             return
@@ -549,9 +996,9 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         guild_id = ctx.guild.id
         user_id = target_member.id
 
-        level, xp, total_xp = self._get_user_data(guild_id, user_id)
+        level, xp, total_xp = await self._get_user_data(guild_id, user_id)
         xp_needed = self._calculate_xp_for_level(level)
-        rank = self._get_user_rank(guild_id, user_id)
+        rank = await self._get_user_rank(guild_id, user_id, total_xp)
         boost = self._get_xp_boost(target_member)
 
         member_roles = [role for role in target_member.roles if role.id != ctx.guild.id] # @everyone rolünü hariç tut
@@ -585,6 +1032,67 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         embed.set_footer(text=f"Toplam Kazanılan XP: {total_xp}")
         await ctx.send(embed=embed)
 
+    async def _fetch_leaderboard(
+        self, guild_id: int, author_id: int, page: int, per_page: int
+    ) -> Tuple[int, int, List[Tuple[int, int, int]]]:
+        """Fetch one leaderboard page.
+
+        Returns (total_entries, page clamped to the last page, [(user_id, level, total_xp), ...]).
+        Queries run on aiosqlite's connection thread, so the event loop is never blocked.
+        """
+        # Toplam giriş sayısı sayfa çevirmelerinde tekrar sayılmasın diye kısa süre önbellekte tutulur
+        cached_count = self._lb_count_cache.get(guild_id)
+        if cached_count is not None and time.monotonic() - cached_count[0] < LB_COUNT_CACHE_TTL_SECONDS:
+            total_entries = cached_count[1]
+        else:
+            # Sayı ve sayfa ayrı sorgulanır: ikisi de kapsayan indeksten okunur. Pencere fonksiyonlu tek sorgu
+            # (COUNT(*) OVER ()) tüm sıralı satırları geçici tabloda sıraladığı için daha yavaştır
+            async with self.db.execute(SQL_LB_COUNT, (guild_id,)) as cur:
+                total_entries_result = await cur.fetchone()
+            total_entries = total_entries_result[0] if total_entries_result else 0
+            self._lb_count_cache[guild_id] = (time.monotonic(), total_entries)
+
+        if total_entries == 0:
+            return 0, 1, []
+
+        total_pages = max(1, (total_entries + per_page - 1) // per_page)
+        page = max(1, min(page, total_pages)) # Sayfanın sınırlar içinde kalmasını sağla
+        offset = (page - 1) * per_page
+
+        # Kullanıcı bir önceki sayfayı az önce gördüyse, OFFSET ile satır atlamak yerine o sayfanın
+        # son satırından (keyset) devam edilir; maliyet sayfa numarasından bağımsızdır
+        page_cursor = self._lb_cursors.pop((guild_id, author_id, page), None)
+        if page_cursor is not None and time.monotonic() - page_cursor[0] < LB_CURSOR_TTL_SECONDS:
+            last_total_xp, last_user_id = page_cursor[1]
+            async with self.db.execute(SQL_LB_PAGE_AFTER, (guild_id, last_total_xp, last_user_id, per_page)) as cur:
+                results = await cur.fetchall()
+        else:
+            async with self.db.execute(SQL_LB_PAGE, (guild_id, per_page, offset)) as cur:
+                results = await cur.fetchall()
+        if results and page < total_pages:
+            last_user_id, _, last_total_xp = results[-1]
+            self._lb_cursors[(guild_id, author_id, page + 1)] = (time.monotonic(), (last_total_xp, last_user_id))
+        return total_entries, page, results
+
+    async def _resolve_members(self, guild: discord.Guild, user_ids: List[int]) -> Dict[int, discord.Member]:
+        """Resolve many user IDs to members: cache first, then one gateway query for the misses."""
+        members: Dict[int, discord.Member] = {}
+        missing = []
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            if member:
+                members[user_id] = member
+            else:
+                missing.append(user_id)
+        if missing:
+            try:
+                # Önbellekte olmayanlar tek bir istekle çekilir (en fazla 100 ID)
+                for member in await guild.query_members(user_ids=missing[:100], limit=len(missing[:100]), cache=True):
+                    members[member.id] = member
+            except Exception as e: # Zaman aşımı veya intent eksikliği: bulunamayanlar ayrılmış üye olarak gösterilir
+                self.logger.warning(f"Üyeler toplu olarak alınamadı (S:{guild.id}): {e}")
+        return members
+
     @commands.command(name="lider")
     @commands.cooldown(1, 10, commands.BucketType.guild)
     async def leaderboard_command(self, ctx: commands.Context, page: int = 1):
@@ -592,63 +1100,48 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         if not ctx.guild:
             await ctx.send("Bu komut sadece sunucularda kullanılabilir.")
             return
-        if not self.conn or not self.cursor:
+        if not self.db:
             await ctx.send("Veritabanı hatası nedeniyle liderlik tablosu alınamıyor.")
             self.logger.error("leaderboard_command: Veritabanı bağlantısı yok.")
             return
 
-        page = max(1, page) # Sayfa numarasının en az 1 olmasını sağla
+        page = max(1, min(page, LB_MAX_PAGE)) # Herhangi bir sorgudan önce sayfayı makul sınırlara çek
         per_page = 10
-        offset = (page - 1) * per_page
         guild_id = ctx.guild.id
 
         try:
-            # Toplam giriş sayısını al
-            self.cursor.execute(
-                "SELECT COUNT(*) FROM users WHERE guild_id = ? AND total_xp > 0",
-                (guild_id,)
-            )
-            total_entries_result = self.cursor.fetchone()
-            total_entries = total_entries_result[0] if total_entries_result else 0
+            total_entries, page, results = await self._fetch_leaderboard(guild_id, ctx.author.id, page, per_page)
 
-            if total_entries == 0:
-                embed = discord.Embed(
+            # Başlık ve renk sunucu başına bir kez hazırlanır; her çağrıda sığ kopyası kullanılır
+            template = self._lb_template.get(guild_id)
+            if template is None:
+                template = self._lb_template[guild_id] = discord.Embed(
                     title=f"🏆 {ctx.guild.name} Liderlik Tablosu (Toplam XP)",
-                    description="Bu sunucuda henüz kimse XP kazanmamış.",
                     color=discord.Color.gold()
                 )
+            embed = copy.copy(template)
+
+            if total_entries == 0:
+                embed.description = "Bu sunucuda henüz kimse XP kazanmamış."
                 await ctx.send(embed=embed)
                 return
 
             total_pages = max(1, (total_entries + per_page - 1) // per_page) # math.ceil yerine
-            page = max(1, min(page, total_pages)) # Sayfanın sınırlar içinde kalmasını sağla
-            offset = (page - 1) * per_page # Offset'i yeniden hesapla (eğer page değiştiyse)
-
-
-            self.cursor.execute(
-                "SELECT user_id, level, total_xp FROM users WHERE guild_id = ? AND total_xp > 0 ORDER BY total_xp DESC LIMIT ? OFFSET ?",
-                (guild_id, per_page, offset)
-            )
-            results = self.cursor.fetchall()
-
-            embed = discord.Embed(
-                title=f"🏆 {ctx.guild.name} Liderlik Tablosu (Toplam XP)",
-                color=discord.Color.gold()
-            )
+            offset = (page - 1) * per_page
 
             if not results and page == 1 : # İlk sayfada bile sonuç yoksa (yukarıdaki total_entries kontrolü bunu yakalamalıydı)
                 embed.description = "Bu sunucuda henüz kimse XP kazanmamış."
             elif not results:
                  embed.description = "Bu sayfada gösterilecek kullanıcı yok."
             else:
-                description = ""
-                for rank_num, (user_id, level, total_xp) in enumerate(results, start=offset + 1):
-                    member = ctx.guild.get_member(user_id)
-                    member_name = member.display_name if member else f"Ayrılmış Üye (ID: {user_id})"
-                    description += (
-                        f"**{rank_num}.** {member_name} - Seviye: {level} (Toplam XP: {total_xp})\n"
-                    )
-                embed.description = description
+                members = await self._resolve_members(ctx.guild, [row[0] for row in results])
+                # Üye adları tek bir sözlükten okunur; satırlar tek bir join ile birleştirilir (tekrarlı += yerine)
+                embed.description = "\n".join(
+                    f"**{rank_num}.** "
+                    f"{members[user_id].display_name if user_id in members else f'Ayrılmış Üye (ID: {user_id})'}"
+                    f" - Seviye: {level} (Toplam XP: {total_xp})"
+                    for rank_num, (user_id, level, total_xp) in enumerate(results, start=offset + 1)
+                )
 
             embed.set_footer(text=f"Sayfa {page}/{total_pages} | Toplam Sıralanan Üye: {total_entries}")
             await ctx.send(embed=embed)
@@ -658,6 +1151,23 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             await ctx.send("Liderlik tablosu alınırken bir hata oluştu.")
 
     # --- Admin Commands ---
+    async def _handle_common_error(
+        self, ctx: commands.Context, error, command_name: str, usage: str, bad_argument: Optional[str] = None
+    ):
+        """Reply to the errors shared by the admin commands using _ERR_MAP."""
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.send(f"❌ Kullanım: {usage}")
+            return
+        message = _ERR_MAP.get(type(error)) # Çoğu hata tam tip eşleşmesiyle O(1) bulunur
+        if message is None: # Alt sınıflar için isinstance ile geri dönüş
+            message = next((msg for err_type, msg in _ERR_MAP.items() if isinstance(error, err_type)), None)
+        if message is None and bad_argument and isinstance(error, commands.BadArgument):
+            message = bad_argument
+        if message is None:
+            self.logger.error(f"{command_name} komut hatası: {error} (Tip: {type(error)})")
+            message = "❓ Komut kullanılırken bilinmeyen bir hata oluştu."
+        await ctx.send(message(error) if callable(message) else message)
+
     @commands.command(name="xpekle", aliases=["addxp"])
     @commands.has_permissions(manage_guild=True)
     @commands.cooldown(1, 2, commands.BucketType.user)
@@ -666,30 +1176,60 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         if amount <= 0:
             await ctx.send("❌ Eklenecek XP miktarı pozitif olmalı.")
             return
-        if not self.conn:
+        if not self.db:
             await ctx.send("❌ Veritabanı hatası nedeniyle XP eklenemiyor.")
             return
 
-        _, new_level, _ = await self._grant_xp(member, ctx.guild, amount)
+        # Admin değişiklikleri beklemeden, tek işlemde diske yazılır
+        results = await self._grant_xp_bulk([member], ctx.guild, amount)
+        if not results:
+            await ctx.send("❌ Veritabanı hatası nedeniyle XP eklenemiyor.")
+            return
+        _, new_level, _ = results[0]
         await ctx.send(f"✅ {member.mention} kullanıcısına **{amount} XP** eklendi. Yeni seviyesi: **{new_level}**.")
 
     @add_xp_command.error
     async def add_xp_error(self, ctx: commands.Context, error):
         """Error handler for add_xp_command."""
         prefix = ctx.prefix # ctx.prefix zaten string olmalı
-        if isinstance(error, commands.MissingPermissions):
-            await ctx.send("❌ Bu komutu kullanmak için 'Sunucuyu Yönet' iznine sahip olmalısınız.")
-        elif isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send(f"❌ Kullanım: `{prefix}xpekle <@üye> <miktar>` (Örn: `{prefix}xpekle @KullanıcıAdı 100`)")
-        elif isinstance(error, commands.MemberNotFound):
-            await ctx.send(f"❌ Üye bulunamadı: `{error.argument}`. Lütfen geçerli bir üye etiketleyin.")
-        elif isinstance(error, commands.BadArgument): # Miktar için
-            await ctx.send("❌ Geçersiz XP miktarı. Lütfen bir sayı girin.")
-        elif isinstance(error, commands.CommandOnCooldown):
-            await ctx.send(f"⏳ Bu komutu tekrar kullanmak için {error.retry_after:.1f} saniye beklemelisiniz.")
-        else:
-            self.logger.error(f"xpekle komut hatası: {error} (Tip: {type(error)})")
-            await ctx.send("❓ Komut kullanılırken bilinmeyen bir hata oluştu.")
+        await self._handle_common_error(
+            ctx, error, "xpekle",
+            usage=f"`{prefix}xpekle <@üye> <miktar>` (Örn: `{prefix}xpekle @KullanıcıAdı 100`)",
+            bad_argument="❌ Geçersiz XP miktarı. Lütfen bir sayı girin."
+        )
+
+
+    @commands.command(name="xpekletoplu", aliases=["bulkaddxp"])
+    @commands.has_permissions(manage_guild=True)
+    @commands.cooldown(1, 5, commands.BucketType.user)
+    async def bulk_add_xp_command(self, ctx: commands.Context, members: commands.Greedy[discord.Member], amount: int):
+        """Add the same amount of XP to several members at once."""
+        if amount <= 0:
+            await ctx.send("❌ Eklenecek XP miktarı pozitif olmalı.")
+            return
+        members = list({member.id: member for member in members if not member.bot}.values()) # Tekrarları ve botları ayıkla
+        if not members:
+            await ctx.send(f"❌ Kullanım: `{ctx.prefix}xpekletoplu <@üye1> <@üye2> ... <miktar>`")
+            return
+        if not self.db:
+            await ctx.send("❌ Veritabanı hatası nedeniyle XP eklenemiyor.")
+            return
+
+        results = await self._grant_xp_bulk(members, ctx.guild, amount)
+        if not results:
+            await ctx.send("❌ Veritabanı hatası nedeniyle XP eklenemiyor.")
+            return
+        await ctx.send(f"✅ **{len(results)}** kullanıcıya **{amount} XP** eklendi.")
+
+    @bulk_add_xp_command.error
+    async def bulk_add_xp_error(self, ctx: commands.Context, error):
+        """Error handler for bulk_add_xp_command."""
+        prefix = ctx.prefix
+        await self._handle_common_error(
+            ctx, error, "xpekletoplu",
+            usage=f"`{prefix}xpekletoplu <@üye1> <@üye2> ... <miktar>` (Örn: `{prefix}xpekletoplu @Ali @Ayşe 100`)",
+            bad_argument="❌ Geçersiz XP miktarı. Lütfen bir sayı girin."
+        )
 
 
     @commands.command(name="xpsil", aliases=["removexp"])
@@ -700,11 +1240,15 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         if amount <= 0:
             await ctx.send("❌ Silinecek XP miktarı pozitif olmalı.")
             return
-        if not self.conn:
+        if not self.db:
             await ctx.send("❌ Veritabanı hatası nedeniyle XP silinemiyor.")
             return
 
-        _, new_level, old_level = await self._grant_xp(member, ctx.guild, -amount) # Negatif değer göndererek XP sil
+        results = await self._grant_xp_bulk([member], ctx.guild, -amount) # Negatif değer göndererek XP sil
+        if not results:
+            await ctx.send("❌ Veritabanı hatası nedeniyle XP silinemiyor.")
+            return
+        _, new_level, old_level = results[0]
         await ctx.send(f"✅ {member.mention} kullanıcısından **{amount} XP** silindi. Yeni seviyesi: **{new_level}**.")
         if new_level < old_level:
             await ctx.send(f"📉 {member.mention}, {old_level}. seviyesinden **{new_level}**. seviyesine düştü.")
@@ -713,86 +1257,66 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
     async def remove_xp_error(self, ctx: commands.Context, error):
         """Error handler for remove_xp_command."""
         prefix = ctx.prefix
-        if isinstance(error, commands.MissingPermissions):
-            await ctx.send("❌ Bu komutu kullanmak için 'Sunucuyu Yönet' iznine sahip olmalısınız.")
-        elif isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send(f"❌ Kullanım: `{prefix}xpsil <@üye> <miktar>` (Örn: `{prefix}xpsil @KullanıcıAdı 50`)")
-        elif isinstance(error, commands.MemberNotFound):
-            await ctx.send(f"❌ Üye bulunamadı: `{error.argument}`. Lütfen geçerli bir üye etiketleyin.")
-        elif isinstance(error, commands.BadArgument):
-            await ctx.send("❌ Geçersiz XP miktarı. Lütfen bir sayı girin.")
-        elif isinstance(error, commands.CommandOnCooldown):
-            await ctx.send(f"⏳ Bu komutu tekrar kullanmak için {error.retry_after:.1f} saniye beklemelisiniz.")
-        else:
-            self.logger.error(f"xpsil komut hatası: {error} (Tip: {type(error)})")
-            await ctx.send("❓ Komut kullanılırken bilinmeyen bir hata oluştu.")
+        await self._handle_common_error(
+            ctx, error, "xpsil",
+            usage=f"`{prefix}xpsil <@üye> <miktar>` (Örn: `{prefix}xpsil @KullanıcıAdı 50`)",
+            bad_argument="❌ Geçersiz XP miktarı. Lütfen bir sayı girin."
+        )
 
     @commands.command(name="seviyesifirla", aliases=["resetxp", "levelreset"])
     @commands.has_permissions(manage_guild=True)
     @commands.cooldown(1, 5, commands.BucketType.user)
     async def reset_xp_command(self, ctx: commands.Context, member: discord.Member):
         """Reset a member's XP and level."""
-        if not self.conn or not self.cursor: # cursor da kontrol edilmeli
+        if not self.db:
             await ctx.send("❌ Veritabanı hatası nedeniyle seviye sıfırlanamıyor.")
             return
 
         guild_id = ctx.guild.id
         user_id = member.id
+        view = _ResetConfirm(author_id=ctx.author.id, timeout=15.0)
         confirmation_msg = await ctx.send(
             f"⚠️ **Emin misiniz?** {member.mention} kullanıcısının tüm seviye/XP ilerlemesi sıfırlanacak "
             f"ve tüm seviye rolleri kaldırılacaktır. Onaylamak için ✅ (15 saniye).",
+            view=view,
             delete_after=20.0 # Mesajın 20 saniye sonra silinmesi
         )
-        await confirmation_msg.add_reaction("✅")
-        await confirmation_msg.add_reaction("❌")
-
-        def check(reaction, user):
-            return user == ctx.author and str(reaction.emoji) in ["✅", "❌"] and reaction.message.id == confirmation_msg.id
+        await view.wait()
 
         try:
-            reaction, user = await self.bot.wait_for('reaction_add', timeout=15.0, check=check)
-            if str(reaction.emoji) == "✅":
+            if view.value is True:
                 try:
                     # Kullanıcının XP'sini ve seviyesini DB'de sıfırla
-                    self.cursor.execute(
-                        "INSERT OR REPLACE INTO users (user_id, guild_id, level, xp, total_xp) VALUES (?, ?, 0, 0, 0)",
-                        (user_id, guild_id)
-                    )
-                    self.conn.commit()
+                    # Sıfırlama bekleyen güncellemelerin yerine geçer ve hemen tek bir BEGIN IMMEDIATE işleminde yazılır
+                    async with self._user_lock(guild_id, user_id):
+                        snapshot = self._snapshot_user(guild_id, user_id)
+                        await self._update_user_xp(guild_id, user_id, 0, 0, 0)
+                        if not await self._flush_pending_xp():
+                            self._restore_users(guild_id, {user_id: snapshot})
+                            raise sqlite3.Error("Sıfırlama veritabanına yazılamadı")
+                    self._lb_count_cache.pop(guild_id, None)
                     # Kullanıcının tüm seviye rollerini kaldır
                     await self._remove_all_level_roles(member, ctx.guild)
-                    await confirmation_msg.edit(content=f"✅ {member.mention} kullanıcısının seviyesi ve XP'si başarıyla sıfırlandı, seviye rolleri kaldırıldı.", delete_after=10.0)
+                    await confirmation_msg.edit(content=f"✅ {member.mention} kullanıcısının seviyesi ve XP'si başarıyla sıfırlandı, seviye rolleri kaldırıldı.", view=None, delete_after=10.0)
                 except Exception as e:
                     self.logger.error(f"Seviye sıfırlama (DB/Rol) hatası: {e}")
-                    await confirmation_msg.edit(content="❌ Sıfırlama sırasında bir veritabanı veya rol hatası oluştu.", delete_after=10.0)
-            else: # '❌' emojisine tıklandı
-                await confirmation_msg.edit(content="❌ İşlem iptal edildi.", delete_after=10.0)
-        except asyncio.TimeoutError:
-            await confirmation_msg.edit(content="⏰ Onay süresi doldu, işlem iptal edildi!", delete_after=10.0)
-        finally:
-            try:
-                await confirmation_msg.clear_reactions() # Zaman aşımı veya işlem sonrası reaksiyonları temizle
-            except discord.Forbidden: # Botun reaksiyonları temizleme izni yoksa
-                pass
-            except discord.NotFound: # Mesaj zaten silinmişse
-                pass
+                    await confirmation_msg.edit(content="❌ Sıfırlama sırasında bir veritabanı veya rol hatası oluştu.", view=None, delete_after=10.0)
+            elif view.value is False: # '❌' butonuna tıklandı
+                await confirmation_msg.edit(content="❌ İşlem iptal edildi.", view=None, delete_after=10.0)
+            else: # Zaman aşımı
+                await confirmation_msg.edit(content="⏰ Onay süresi doldu, işlem iptal edildi!", view=None, delete_after=10.0)
+        except discord.NotFound: # Mesaj zaten silinmişse
+            pass
 
 
     @reset_xp_command.error
     async def reset_xp_error(self, ctx: commands.Context, error):
         """Error handler for reset_xp_command."""
         prefix = ctx.prefix
-        if isinstance(error, commands.MissingPermissions):
-            await ctx.send("❌ Bu komutu kullanmak için 'Sunucuyu Yönet' iznine sahip olmalısınız.")
-        elif isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send(f"❌ Kullanım: `{prefix}seviyesifirla <@üye>` (Örn: `{prefix}seviyesifirla @KullanıcıAdı`)")
-        elif isinstance(error, commands.MemberNotFound):
-            await ctx.send(f"❌ Üye bulunamadı: `{error.argument}`. Lütfen geçerli bir üye etiketleyin.")
-        elif isinstance(error, commands.CommandOnCooldown):
-            await ctx.send(f"⏳ Bu komutu tekrar kullanmak için {error.retry_after:.1f} saniye beklemelisiniz.")
-        else:
-            self.logger.error(f"seviyesifirla komut hatası: {error} (Tip: {type(error)})")
-            await ctx.send("❓ Komut kullanılırken bilinmeyen bir hata oluştu.")
+        await self._handle_common_error(
+            ctx, error, "seviyesifirla",
+            usage=f"`{prefix}seviyesifirla <@üye>` (Örn: `{prefix}seviyesifirla @KullanıcıAdı`)"
+        )
 
 
     @commands.command(name="xpayar")
@@ -806,7 +1330,8 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
             await ctx.send("❌ Minimum XP, maksimum XP'den büyük olamaz.")
             return
         self.config["xp_range"] = {"min": min_xp, "max": max_xp}
-        self._save_config()
+        self._build_xp_draw_cache()
+        self._mark_cfg_dirty()
         await ctx.send(f"✅ Mesaj başına kazanılacak XP aralığı güncellendi: **{min_xp} - {max_xp} XP**.")
 
     @commands.command(name="kanalengelle")
@@ -817,9 +1342,10 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
         if "blacklisted_channels" not in self.config: # Eğer liste config'de yoksa oluştur
             self.config["blacklisted_channels"] = []
 
-        if channel_id not in self.config["blacklisted_channels"]:
+        if channel_id not in self._blacklist:
             self.config["blacklisted_channels"].append(channel_id)
-            self._save_config()
+            self._blacklist.add(channel_id)
+            self._mark_cfg_dirty()
             await ctx.send(f"✅ {channel.mention} kanalı XP kazanımı için başarıyla engellendi.")
         else:
             await ctx.send(f"ℹ️ {channel.mention} kanalı zaten XP kazanımına engelli.")
@@ -830,9 +1356,13 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
     async def unblacklist_channel(self, ctx: commands.Context, channel: discord.TextChannel):
         """Remove a channel from the XP blacklist."""
         channel_id = channel.id
-        if "blacklisted_channels" in self.config and channel_id in self.config["blacklisted_channels"]:
-            self.config["blacklisted_channels"].remove(channel_id)
-            self._save_config()
+        if channel_id in self._blacklist:
+            # JSON'da elle girilmiş string ID'ler de olabilir, ikisini de temizle
+            self.config["blacklisted_channels"] = [
+                c for c in self.config.get("blacklisted_channels", []) if str(c) != str(channel_id)
+            ]
+            self._blacklist.discard(channel_id)
+            self._mark_cfg_dirty()
             await ctx.send(f"✅ {channel.mention} kanalının XP kazanım engeli başarıyla kaldırıldı.")
         else:
             await ctx.send(f"ℹ️ {channel.mention} kanalı zaten XP kazanımına engelli değil.")
@@ -849,7 +1379,11 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
 
         target_id = str(target.id) # Config dosyasında ID'ler string olarak tutulabilir
         self.config["xp_boosts"][target_id] = multiplier
-        self._save_config()
+        # Bellekteki tamsayı anahtarlı kopyayı yerinde güncelle (tüm config'i yeniden ayrıştırmadan)
+        self._boosts[target.id] = multiplier
+        if multiplier not in self._xp_draw:
+            self._xp_draw[multiplier] = self._make_xp_draw(multiplier)
+        self._mark_cfg_dirty()
         target_type = "üye" if isinstance(target, discord.Member) else "rol"
         await ctx.send(f"✅ {target.mention} ({target_type}) için XP çarpanı **x{multiplier:.2f}** olarak ayarlandı.")
 
@@ -857,51 +1391,57 @@ class LevelingCog(commands.Cog, name="Seviye Sistemi"):
     async def set_xp_boost_error(self, ctx: commands.Context, error):
         """Error handler for set_xp_boost command."""
         prefix = ctx.prefix
-        if isinstance(error, commands.MissingPermissions):
-            await ctx.send("❌ Bu komutu kullanmak için 'Sunucuyu Yönet' iznine sahip olmalısınız.")
-        elif isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send(f"❌ Kullanım: `{prefix}xpboost <@üye veya @rol> <çarpan>` (Örn: `{prefix}xpboost @YetkiliRolü 1.5`)")
-        elif isinstance(error, commands.BadUnionArgument): # Hem Member hem Role için ortak hata
-             await ctx.send(f"❌ Geçersiz hedef. Lütfen bir üye (@üye) veya bir rol (@rol) etiketleyin. `{error.param.name}` parametresi için `{error.argument}` değeri geçersiz.")
-        elif isinstance(error, commands.BadArgument): # Çarpan için
-            await ctx.send("❌ Geçersiz çarpan. Lütfen bir sayı girin (örneğin: 1.5 veya 2).")
-        else:
-            self.logger.error(f"xpboost komut hatası: {error} (Tip: {type(error)})")
-            await ctx.send("❓ Komut kullanılırken bilinmeyen bir hata oluştu.")
+        if isinstance(error, commands.BadUnionArgument): # Hem Member hem Role için ortak hata
+            await ctx.send(f"❌ Geçersiz hedef. Lütfen bir üye (@üye) veya bir rol (@rol) etiketleyin. `{error.param.name}` parametresi için verilen değer geçersiz.")
+            return
+        await self._handle_common_error(
+            ctx, error, "xpboost",
+            usage=f"`{prefix}xpboost <@üye veya @rol> <çarpan>` (Örn: `{prefix}xpboost @YetkiliRolü 1.5`)",
+            bad_argument="❌ Geçersiz çarpan. Lütfen bir sayı girin (örneğin: 1.5 veya 2)."
+        )
 
 
     @commands.command(name="xpboostkaldir")
     @commands.has_permissions(manage_guild=True)
     async def remove_xp_boost(self, ctx: commands.Context, target: discord.Member | discord.Role):
         """Remove an XP boost from a user or role."""
-        target_id = str(target.id)
-        if "xp_boosts" in self.config and target_id in self.config["xp_boosts"]:
-            del self.config["xp_boosts"][target_id]
-            self._save_config()
+        if target.id in self._boosts:
+            self.config.get("xp_boosts", {}).pop(str(target.id), None)
+            self._boosts.pop(target.id, None) # Kullanılmayan çekiliş tablosu zararsızdır, bir sonraki yüklemede düşer
+            self._mark_cfg_dirty()
             target_type = "üye" if isinstance(target, discord.Member) else "rol"
             await ctx.send(f"✅ {target.mention} ({target_type}) için tanımlanmış XP çarpanı başarıyla kaldırıldı.")
         else:
             await ctx.send(f"ℹ️ {target.mention} için zaten tanımlı bir XP çarpanı bulunmuyor.")
 
     # --- Cog Lifecycle ---
-    def cog_unload(self):
+    async def cog_unload(self):
         """Clean up when the cog is unloaded."""
-        if self.conn:
-            self.conn.close()
-            self.logger.info("Cog kaldırıldı, veritabanı bağlantısı kapatıldı.")
+        # Döngü bir yazmanın ortasında iptal edilmesin: yürüyen yazma kilidi bırakana kadar beklenir
+        async with self._write_lock:
+            self._flush_xp.cancel()
+        self._refresh_threshold_xp.cancel()
+        self._prune_cooldowns.cancel()
+        if self._cfg_flush_task and not self._cfg_flush_task.done():
+            self._cfg_flush_task.cancel()
+        await self._flush_config_now()
+        if self._writer:
+            if self._flush_task and not self._flush_task.done():
+                await self._flush_task
+            await self._flush_pending_xp()
+            try:
+                await self._writer.execute("PRAGMA optimize") # Kapanmadan önce sorgu planlayıcı istatistiklerini güncelle
+            except sqlite3.Error as e:
+                self.logger.warning(f"PRAGMA optimize çalıştırılamadı: {e}")
+            await self._writer.close()
+            self._writer = None
+        if self.db:
+            await self.db.close()
+            self.db = None
+            self.logger.info("Cog kaldırıldı, veritabanı bağlantıları kapatıldı.")
 
 async def setup(bot: commands.Bot):
     """Setup function to load the cog."""
-    try:
-        import sqlite3 # Bu zaten en başta import edilmişti ama burada tekrar kontrol etmek iyi bir pratik.
-    except ImportError:
-        logging.critical("SQLite3 modülü bulunamadı! Seviye sistemi ÇALIŞMAYACAK. Lütfen `pip install pysqlite3` veya sisteminize uygun sqlite3 paketini kurun.")
-        return
-
-    # Veritabanı dosyasının varlığını kontrol et, yoksa uyarı ver. _init_db zaten oluşturacak.
-    if not os.path.exists(DB_NAME):
-        logging.warning(f"'{DB_NAME}' veritabanı dosyası bulunamadı. İlk XP kazanımında veya bot başlatıldığında oluşturulacaktır.")
-
     await bot.add_cog(LevelingCog(bot))
     logging.info("Leveling Cog (Seviye Sistemi) başarıyla yüklendi!")
     # Düzeltildi: "hata alıyorum" kısmı kaldırıldı.
\ No newline at end of file
@@ -1,28 +1,43 @@
 # commands/partner.py
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import sqlite3
+import aiosqlite
 import logging
+import logging.handlers
+import queue
 import datetime
 import re
-import os
+import time
+import asyncio
+import contextlib
 import pytz  # Zaman dilimi dönüşümleri için
-from typing import Optional, List, Tuple
+from typing import AsyncIterator, Dict, Optional, List, Tuple
 
 # --- Configuration ---
 DB_NAME = "partners.db"
 LOG_FILE = "partner_system.log"
+# Discord davet linki deseni; modül yüklenirken bir kez derlenir (şema yakalanmaz, tek grup davet kodudur)
+INVITE_RE = re.compile(r"(?:https?://)?discord\.gg/([\w-]+)")  # Grup 1: davet kodu
+INVITE_NAME_CACHE_TTL_SECONDS = 3600  # Davet linki -> sunucu adı sonuçlarının bellekte tutulma süresi
+INVITE_CACHE_TTL_SECONDS = 600  # Davet linki -> fetch_invite sonucunun bellekte tutulma süresi
+INVITE_CACHE_PRUNE_INTERVAL_SECONDS = 600  # Süresi dolmuş davet önbelleği kayıtlarının temizlenme aralığı
+# Toplu yazmada aynı ifade metni kullanılır; sqlite3 ifadeyi bir kez hazırlar ve executemany ile tekrar kullanır
+SQL_INSERT_PARTNER = (
+    "INSERT INTO partners (user_id, guild_id, invite_link, timestamp, guild_name) VALUES (?, ?, ?, ?, ?)"
+)
+LB_CACHE_TTL_SECONDS = 30  # Lider tablosu sorgu sonucunun bellekte tutulma süresi
+INVITE_RESOLVE_CONCURRENCY = 5  # Aynı anda çözülecek en fazla davet linki (Discord hız sınırı için)
+STATS_FIELD_MAX_ROWS = 25  # partnerstats'ta her dönem alanında gösterilecek en fazla satır
+STATS_FIELD_CHAR_BUDGET = 1000  # Embed alan sınırı (1024) altında, "+N daha" ekine yer bırakan karakter bütçesi
+GUILD_NAME_MAX_LENGTH = 100  # Discord sunucu adı üst sınırı; adı henüz çözülmemiş satırların uzunluk tahmini için
+STATS_FETCH_BATCH_SIZE = 64  # partnerstats sorgusunda her seferde okunacak satır sayısı
+PARTNER_WRITE_BATCH_SIZE = 64  # Tek commit ile yazılacak en fazla partner kaydı
+PARTNER_WRITE_MAX_DELAY_SECONDS = 0.5  # İlk kayıttan sonra toplu yazma için en fazla beklenen süre
 
 # --- Logging Setup ---
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),  # encoding ekleyin
-        logging.StreamHandler()
-    ]
-)
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
 
 # Türkiye zaman dilimini tanımla (UTC+3)
 TURKEY_TZ = pytz.timezone("Europe/Istanbul")
@@ -33,100 +48,262 @@ class PartnershipCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = logging.getLogger("PartnershipCog")
-        self._init_db()  # Veritabanını yapıcıda başlat
-
-    def _init_db(self):
+        self._start_log_listener()
+        self.db: Optional[aiosqlite.Connection] = None  # Tek, uzun ömürlü bağlantı (sorgular ayrı bir thread'de çalışır)
+        self._invite_name_cache: Dict[str, Tuple[float, str]] = {}  # davet linki -> (çözülme zamanı, sunucu adı)
+        self._invite_cache: Dict[str, Tuple[float, discord.Invite]] = {}  # davet linki -> (çözülme zamanı, davet)
+        # Lider tablosu önbelleği: (hesaplanma zamanı, limit, sonuç); yeni kayıtlar yazılınca sıfırlanır
+        self._lb_cache: Optional[Tuple[float, int, List[Tuple[int, int]]]] = None
+        self._partner_channel_id = self._load_partner_channel_id()  # Her mesajda config okumamak için bir kez çözülür
+        # Veritabanı bağlantısı event loop'u bloklamamak için asenkron açılır
+        self._db_init_task = self.bot.loop.create_task(self._init_db())
+        # Partner kayıtları kuyruğa alınır ve arka planda toplu olarak yazılır
+        self._write_queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task = self.bot.loop.create_task(self._drain_writes())
+        self._prune_invite_caches.start()
+
+    async def _init_db(self):
         """SQLite veritabanını başlat."""
+        db = None
         try:
-            self.conn = sqlite3.connect(DB_NAME)
-            self.cursor = self.conn.cursor()
-            self.cursor.execute("""
+            db = await aiosqlite.connect(DB_NAME)
+            # Bağlantı uzun ömürlü olduğu için ayarlar ve sayfa önbelleği bir kez kurulur
+            await db.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA cache_size=-20000;
+                PRAGMA mmap_size=134217728;
+            """)
+            async with db.execute("SELECT COUNT(*) FROM sqlite_master") as cur:
+                if (await cur.fetchone())[0] == 0:
+                    self.logger.warning(f"'{DB_NAME}' veritabanı boş, partner tablosu oluşturuluyor.")
+            await db.execute("""
                 CREATE TABLE IF NOT EXISTS partners (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER NOT NULL,
                     guild_id INTEGER NOT NULL,
                     invite_link TEXT NOT NULL,
-                    timestamp DATETIME NOT NULL
+                    timestamp INTEGER NOT NULL,
+                    guild_name TEXT
                 )
             """)
-            self.conn.commit()
+            # Eski tablolara sunucu adı sütununu ekle (ad kayıt anında yazılır, istatistikler davet linkini tekrar çözmez)
+            async with db.execute("PRAGMA table_info(partners)") as cur:
+                columns = {row[1] for row in await cur.fetchall()}
+            if "guild_name" not in columns:
+                await db.execute("ALTER TABLE partners ADD COLUMN guild_name TEXT")
+                self.logger.info("DB'ye 'guild_name' sütunu eklendi.")
+            # Eski sürümlerin Türkiye saatiyle (UTC+3) yazdığı metin zaman damgalarını Unix saniyesine çevir
+            await db.execute(
+                "UPDATE partners SET timestamp = CAST(strftime('%s', timestamp) AS INTEGER) - 10800 "
+                "WHERE typeof(timestamp) = 'text' AND strftime('%s', timestamp) IS NOT NULL"
+            )
+            # Çevrilemeyen kayıtlar dönem sorgularını bozar (metin her sayıdan büyük sıralanır); loglanıp silinir
+            async with db.execute(
+                "SELECT id, user_id, invite_link, timestamp FROM partners WHERE typeof(timestamp) = 'text'"
+            ) as cur:
+                bad_rows = await cur.fetchall()
+            if bad_rows:
+                for row_id, user_id, invite_link, timestamp in bad_rows:
+                    self.logger.warning(
+                        f"Zaman damgası çevrilemeyen partner kaydı siliniyor: ID {row_id}, Kullanıcı {user_id}, "
+                        f"Link {invite_link}, Zaman {timestamp!r}"
+                    )
+                await db.executemany("DELETE FROM partners WHERE id = ?", [(row[0],) for row in bad_rows])
+            # Dönem sorguları zaman aralığı taramasıyla, lider tablosu GROUP BY user_id ile indeksten okunur
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_partners_ts ON partners (timestamp DESC)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_partners_user ON partners (user_id)")
+            await db.commit()
+            self.db = db
             self.logger.info(f"'{DB_NAME}' veritabanına bağlandı.")
         except sqlite3.Error as e:  # Daha spesifik hata yakalama
             self.logger.error(f"Veritabanı başlatma hatası: {e}")
-            self.conn = None
-            self.cursor = None
-
-    def _add_partner_record(self, user_id: int, guild_id: int, invite_link: str, timestamp: datetime.datetime):
-        """Veritabanına yeni bir partner kaydı ekle."""
-        if not self.conn:  # Basitleştirilmiş bağlantı kontrolü
-            self.logger.error("Veritabanı bağlantısı yok, partner kaydı eklenemiyor.")
+            if db:
+                await db.close()
+            self.db = None
+
+    def _start_log_listener(self):
+        """Cog loglarının dosyaya yazılmasını QueueListener thread'ine taşı."""
+        # Event loop'ta sadece kuyruğa koyma yapılır; yavaş dosya yazımı loop'u bekletmez.
+        # Konsol ve Discord log kanalı için kayıtlar root logger'a gitmeye devam eder (propagate açık)
+        self._log_queue: queue.Queue = queue.Queue(-1)
+        file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8', delay=True)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self._log_listener = logging.handlers.QueueListener(self._log_queue, file_handler)
+        self._log_listener.start()
+        self._log_handler = logging.handlers.QueueHandler(self._log_queue)
+        self.logger.addHandler(self._log_handler)
+        self.logger.setLevel(logging.INFO)
+
+    def _stop_log_listener(self):
+        """Kuyruk handler'ını kaldır, kalan kayıtları yazdır ve listener thread'ini durdur."""
+        self.logger.removeHandler(self._log_handler)
+        self._log_listener.stop()  # Kuyrukta kalan log kayıtlarını yazar ve thread'i durdurur
+        for handler in self._log_listener.handlers:
+            handler.close()
+
+    def _load_partner_channel_id(self) -> Optional[int]:
+        """Bot config'inden PARTNER_CHANNEL_ID değerini bir kez oku."""
+        partner_channel_id = self.bot.config.get("PARTNER_CHANNEL_ID")
+        if not partner_channel_id:
+            self.logger.error("[Hata] Yapılandırmada PARTNER_CHANNEL_ID bulunamadı.")
+            return None
+        try:
+            return int(partner_channel_id)
+        except (ValueError, TypeError):
+            self.logger.error(f"[Hata] Geçersiz PARTNER_CHANNEL_ID: {partner_channel_id}")
+            return None
+
+    @staticmethod
+    def _local_day_start(day: datetime.date) -> int:
+        """Verilen günün Türkiye saatine göre başladığı anı Unix zamanı olarak döndür."""
+        return int(TURKEY_TZ.localize(datetime.datetime.combine(day, datetime.time.min)).timestamp())
+
+    async def _add_partner_record(
+        self, user_id: int, guild_id: int, invite_link: str, timestamp: datetime.datetime, guild_name: Optional[str] = None
+    ):
+        """Yeni bir partner kaydını yazma kuyruğuna ekle; _drain_writes kayıtları toplu olarak yazar."""
+        # Zaman damgası Unix saniyesi olarak saklanır; Türkiye saati sadece log ve gösterim için
+        timestamp_tr = timestamp.astimezone(TURKEY_TZ)
+        self._write_queue.put_nowait((user_id, guild_id, invite_link, int(timestamp_tr.timestamp()), guild_name))
+        self.logger.info(f"Partner kaydı kuyruğa eklendi: Kullanıcı {user_id}, Sunucu {guild_id}, Link {invite_link}, Zaman {timestamp_tr}")
+
+    async def _write_partner_batch(self, batch: List[tuple]):
+        """Bir grup partner kaydını tek bir commit ile yaz."""
+        if not self.db:
+            self.logger.error(f"Veritabanı bağlantısı yok, {len(batch)} partner kaydı yazılamadı.")
             return
-
         try:
-            # Zaman damgasını Türkiye zaman dilimine çevirerek kaydet
-            timestamp_tr = timestamp.astimezone(TURKEY_TZ)
-            self.cursor.execute(
-                "INSERT INTO partners (user_id, guild_id, invite_link, timestamp) VALUES (?, ?, ?, ?)",
-                (user_id, guild_id, invite_link, timestamp_tr.strftime("%Y-%m-%d %H:%M:%S"))
-            )
-            self.conn.commit()
-            self.logger.info(f"Partner kaydı eklendi: Kullanıcı {user_id}, Sunucu {guild_id}, Link {invite_link}, Zaman {timestamp_tr}")
+            await self.db.executemany(SQL_INSERT_PARTNER, batch)
+            await self.db.commit()
+            # Yeni partnerlikler lider tablosunda hemen görünsün
+            self._lb_cache = None
+            self.logger.info(f"{len(batch)} partner kaydı veritabanına yazıldı.")
         except sqlite3.Error as e:
-            self.logger.error(f"Partner kaydı eklenirken hata: {e}")
-
-    def _get_partner_details(self, period: str) -> List[Tuple[int, str, str]]:
-        """Belirli bir dönem için partner ayrıntılarını al."""
-        if not self.conn or not self.cursor:
+            self.logger.error(f"Partner kayıtları eklenirken hata: {e}")
+
+    async def _drain_writes(self):
+        """Kuyruktaki kayıtları en fazla PARTNER_WRITE_BATCH_SIZE adet veya PARTNER_WRITE_MAX_DELAY_SECONDS süre biriktirip yaz.
+
+        Kuyruğa None konduğunda elde kalanları yazıp çıkar.
+        """
+        await self._db_init_task
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._write_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = loop.time() + PARTNER_WRITE_MAX_DELAY_SECONDS
+            while len(batch) < PARTNER_WRITE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._write_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._write_partner_batch(batch)
+            if stop:
+                return
+
+    async def _iter_partner_details_since(self, since_ts: int) -> AsyncIterator[Tuple[int, str, int, Optional[str]]]:
+        """Belirli bir andan bu yana yapılan partnerlikleri (yeniden eskiye) parça parça oku.
+
+        Tüm sonuç listeye alınmaz; çağıran yeterli satırı aldığında döngüden çıkabilir.
+        """
+        if not self.db:
             self.logger.error("Veritabanı bağlantısı yok, partner detayları alınamıyor.")
-            return []
-
-        today = datetime.date.today()
-        if period == "daily":
-            start_date = today.strftime("%Y-%m-%d")
-            query = "SELECT user_id, invite_link, timestamp FROM partners WHERE DATE(timestamp) = ? ORDER BY timestamp DESC"
-            params = (start_date,)
-        elif period == "monthly":
-            start_date = today.replace(day=1).strftime("%Y-%m-%d")
-            query = "SELECT user_id, invite_link, timestamp FROM partners WHERE timestamp >= ? ORDER BY timestamp DESC"
-            params = (start_date,)
-        elif period == "yearly":
-            start_date = today.replace(month=1, day=1).strftime("%Y-%m-%d")
-            query = "SELECT user_id, invite_link, timestamp FROM partners WHERE timestamp >= ? ORDER BY timestamp DESC"
-            params = (start_date,)
-        else:
-            self.logger.warning(f"Geçersiz dönem istendi: {period}")
-            return []
+            return
 
         try:
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+            async with self.db.execute(
+                "SELECT user_id, invite_link, timestamp, guild_name FROM partners WHERE timestamp >= ? ORDER BY timestamp DESC",
+                (since_ts,)
+            ) as cur:
+                while True:
+                    rows = await cur.fetchmany(STATS_FETCH_BATCH_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
         except sqlite3.Error as e:
             self.logger.error(f"Partner detayları alınırken hata: {e}")
-            return []
 
-    def _get_leaderboard(self, limit: int = 10) -> List[Tuple[int, int]]:
+    async def _count_partners_since(self, day_start: int, month_start: int, year_start: int) -> Tuple[int, int, int]:
+        """Günlük, aylık ve yıllık partnerlik sayılarını tek sorguda al."""
+        if not self.db:
+            self.logger.error("Veritabanı bağlantısı yok, partner sayıları alınamıyor.")
+            return 0, 0, 0
+
+        try:
+            # Sadece timestamp okunur; sorgu idx_partners_ts indeksinden cevaplanır
+            async with self.db.execute(
+                "SELECT COALESCE(SUM(timestamp >= ?), 0), COALESCE(SUM(timestamp >= ?), 0), COUNT(*) "
+                "FROM partners WHERE timestamp >= ?",
+                (day_start, month_start, year_start)
+            ) as cur:
+                return await cur.fetchone()
+        except sqlite3.Error as e:
+            self.logger.error(f"Partner sayıları alınırken hata: {e}")
+            return 0, 0, 0
+
+    async def _get_leaderboard(self, limit: int = 10) -> List[Tuple[int, int]]:
         """En çok partnerliği olan kullanıcıların lider tablosunu al."""
-        if not self.conn or not self.cursor:
+        if not self.db:
             self.logger.error("Veritabanı bağlantısı yok, lider tablosu alınamıyor.")
             return []
 
+        # Tablo tamamen taranıp gruplandığından sonuç kısa bir süre tekrar kullanılır
+        cached = self._lb_cache
+        if cached is not None and cached[1] == limit and time.monotonic() - cached[0] < LB_CACHE_TTL_SECONDS:
+            return cached[2]
+
         try:
-            self.cursor.execute(
+            async with self.db.execute(
                 "SELECT user_id, COUNT(*) as count FROM partners GROUP BY user_id ORDER BY count DESC LIMIT ?",
                 (limit,)
-            )
-            return self.cursor.fetchall()
+            ) as cur:
+                rows = await cur.fetchall()
+            self._lb_cache = (time.monotonic(), limit, rows)
+            return rows
         except sqlite3.Error as e:
             self.logger.error(f"Lider tablosu alınırken hata: {e}")
             return []
 
+    async def _resolve_invite(self, invite_link: str) -> discord.Invite:
+        """Bir davet linkini çöz; başarılı sonuçlar bir süre önbellekte tutulur (hatalar çağırana iletilir)."""
+        cached = self._invite_cache.get(invite_link)
+        if cached is not None and time.monotonic() - cached[0] < INVITE_CACHE_TTL_SECONDS:
+            return cached[1]
+        invite = await self.bot.fetch_invite(invite_link)
+        now = time.monotonic()
+        self._invite_cache[invite_link] = (now, invite)
+        # İstatistik komutu aynı link için tekrar istek atmasın diye sunucu adı da saklanır
+        if invite.guild:
+            self._invite_name_cache[invite_link] = (now, invite.guild.name)
+        return invite
+
     async def _get_server_name_from_invite(self, invite_link: str) -> Optional[str]:
-        """Bir Discord davet linkinden sunucu adını al."""
+        """Bir Discord davet linkinden sunucu adını al (sonuçlar bir süre önbellekte tutulur)."""
+        cached = self._invite_name_cache.get(invite_link)
+        if cached is not None and time.monotonic() - cached[0] < INVITE_NAME_CACHE_TTL_SECONDS:
+            return cached[1]
         try:
-            invite = await self.bot.fetch_invite(invite_link)
-            return invite.guild.name if invite.guild else "Bilinmeyen Sunucu"
+            invite = await self._resolve_invite(invite_link)
+            name = invite.guild.name if invite.guild else "Bilinmeyen Sunucu"
+            self._invite_name_cache[invite_link] = (time.monotonic(), name)
+            return name
         except discord.errors.NotFound:
             self.logger.warning(f"Geçersiz davet linki: {invite_link}")
+            # Silinmiş davetler geri gelmez; tekrar sormamak için bu sonuç da önbelleğe alınır
+            self._invite_name_cache[invite_link] = (time.monotonic(), "Geçersiz Link")
             return "Geçersiz Link"
         except discord.errors.Forbidden:
             self.logger.error(f"Botun davet linkine erişim izni yok: {invite_link}")
@@ -138,6 +315,36 @@ class PartnershipCog(commands.Cog):
             self.logger.error(f"Davet linkinden sunucu adı alınırken hata: {e}")
             return "Hata"
 
+    async def _resolve_server_names(self, invite_links: List[str]) -> Dict[str, str]:
+        """Birden fazla davet linkini eşzamanlı çöz; link -> sunucu adı sözlüğü döndürür."""
+        semaphore = asyncio.Semaphore(INVITE_RESOLVE_CONCURRENCY)
+
+        async def resolve(link: str) -> Optional[str]:
+            async with semaphore:
+                return await self._get_server_name_from_invite(link)
+
+        # İstekler sırayla değil birlikte beklenir: toplam süre ~ en yavaş istek, N × gidiş-dönüş değil
+        results = await asyncio.gather(*(resolve(link) for link in invite_links), return_exceptions=True)
+        names = {}
+        for link, result in zip(invite_links, results):
+            if isinstance(result, BaseException):
+                self.logger.error(f"Davet linkinden sunucu adı alınırken hata: {result}")
+                result = "Hata"
+            names[link] = result
+        return names
+
+    @tasks.loop(seconds=INVITE_CACHE_PRUNE_INTERVAL_SECONDS)
+    async def _prune_invite_caches(self):
+        """Süresi dolmuş davet önbelleği kayıtlarını sil; TTL sadece okurken kontrol edildiğinden sözlükler yoksa hep büyür."""
+        now = time.monotonic()
+        name_cutoff = now - INVITE_NAME_CACHE_TTL_SECONDS
+        for link in [link for link, (resolved, _) in self._invite_name_cache.items() if resolved < name_cutoff]:
+            del self._invite_name_cache[link]
+
+        invite_cutoff = now - INVITE_CACHE_TTL_SECONDS
+        for link in [link for link, (resolved, _) in self._invite_cache.items() if resolved < invite_cutoff]:
+            del self._invite_cache[link]
+
     # --- Event Listener ---
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -147,28 +354,25 @@ class PartnershipCog(commands.Cog):
         if message.author.bot or message.guild is None:
             return
 
-        # Ayarlardan partner kanalının ID'sini al
-        partner_channel_id = self.bot.config.get("PARTNER_CHANNEL_ID")
-        if not partner_channel_id:
-            self.logger.error("[Hata] Yapılandırmada PARTNER_CHANNEL_ID bulunamadı.")
+        # Mesajların neredeyse hiçbiri davet linki içermez; en ucuz kontrol en başta
+        if "discord.gg" not in message.content:
             return
 
-        # Sadece belirlenen partner kanalındaki mesajları işle
-        if message.channel.id != int(partner_channel_id):
+        # Sadece belirlenen partner kanalındaki mesajları işle (kanal ID'si __init__'te çözüldü)
+        if self._partner_channel_id is None or message.channel.id != self._partner_channel_id:
             return
 
-        # Mesajda Discord davet linki var mı kontrol et
-        invite_pattern = r"(https?://)?discord\.gg/[\w-]+"
-        invites = re.findall(invite_pattern, message.content)
-        if not invites:
+        # Mesajdaki davet kodlarından standart linkler kurulur; aynı link iki kez yazıldıysa
+        # mesajdaki sırası korunarak bir kez işlenir (tek istek, tek kayıt)
+        invite_links = list(dict.fromkeys(
+            f"https://discord.gg/{m.group(1)}" for m in INVITE_RE.finditer(message.content)
+        ))
+        if not invite_links:
             return
 
-        for invite_link in invites:
-            if not invite_link.startswith("http"):
-                invite_link = f"https://{invite_link}"
-
+        for invite_link in invite_links:
             try:
-                invite = await self.bot.fetch_invite(invite_link)
+                invite = await self._resolve_invite(invite_link)
                 if not invite.guild:
                     self.logger.warning(f"Geçersiz davet linki: {invite_link}")
                     continue
@@ -183,9 +387,9 @@ class PartnershipCog(commands.Cog):
                 self.logger.error(f"Davet linki kontrol edilirken hata: {e}")
                 continue
 
-            # Partnerliği kaydet
+            # Partnerliği kaydet (kayıt fonksiyonu datetime bekler, metin sadece bildirim için)
             timestamp = message.created_at.strftime("%Y-%m-%d %H:%M:%S")
-            self._add_partner_record(message.author.id, guild_id, invite_link, timestamp)
+            await self._add_partner_record(message.author.id, guild_id, invite_link, message.created_at, invite.guild.name)
 
             # Bildirim embed'ini oluştur
             embed = discord.Embed(
@@ -231,14 +435,48 @@ class PartnershipCog(commands.Cog):
         if not ctx.guild:
             await ctx.send("Bu komut sadece sunucularda kullanılabilir.")
             return
-        if not self.conn:
+        if not self.db:
             await ctx.send("Veritabanı hatası nedeniyle istatistikler alınamıyor.")
             return
 
-        # Get partner details for each period
-        daily_partners = self._get_partner_details("daily")
-        monthly_partners = self._get_partner_details("monthly")
-        yearly_partners = self._get_partner_details("yearly")
+        today = datetime.datetime.now(TURKEY_TZ).date()
+        day_start = self._local_day_start(today)
+        month_start = self._local_day_start(today.replace(day=1))
+        year_start = self._local_day_start(today.replace(month=1, day=1))
+
+        # Günlük ⊂ aylık ⊂ yıllık ve satırlar yeniden eskiye geldiğinden, gösterilebilecek tüm satırlar
+        # yılın ilk STATS_FIELD_MAX_ROWS satırıdır; o kadarı okununca sorgu bırakılır
+        visible_rows = []
+        async with contextlib.aclosing(self._iter_partner_details_since(year_start)) as rows:
+            async for row in rows:
+                visible_rows.append(row)
+                if len(visible_rows) >= STATS_FIELD_MAX_ROWS:
+                    break
+        # Sayılar satırlardan sonra alınır: arada yazılan kayıtlar sayıyı sadece artırır, gösterilen satırlar sayıyı aşmaz
+        daily_count, monthly_count, yearly_count = await self._count_partners_since(day_start, month_start, year_start)
+        monthly_partners = [row for row in visible_rows if row[2] >= month_start]
+        daily_partners = [row for row in monthly_partners if row[2] >= day_start]
+
+        # Aynı üye üç dönemde de görünür; her üyenin adı bir kez çözülür
+        name_map = {}
+        for user_id in dict.fromkeys(row[0] for row in visible_rows):
+            member = ctx.guild.get_member(user_id)
+            name_map[user_id] = member.display_name if member else f"Ayrılmış Üye (ID: {user_id})"
+
+        # Sunucu adı kayıt anında saklanır; sadece adı olmayan eski kayıtların linkleri çözülür.
+        # Günlük ve aylık alanlar yıllık listenin başıdır, bu yüzden yalnızca yıllık alana sığan satırların
+        # linkleri çözülür. Çözülmemiş adlar en uzun haliyle hesaba katılır; alana sığmayan ilk satır da çözülür,
+        # çünkü gerçek adı kısaysa sığabilir. Her turda farklı linkler eşzamanlı çözülür
+        server_names: Dict[str, str] = {}
+        while True:
+            shown = len(self._fit_partner_lines(visible_rows, name_map, server_names))
+            unresolved = list(dict.fromkeys(
+                invite_link for _, invite_link, _, guild_name in visible_rows[:shown + 1]
+                if guild_name is None and invite_link not in server_names
+            ))
+            if not unresolved:
+                break
+            server_names.update(await self._resolve_server_names(unresolved))
 
         # Prepare the embed with red color
         embed = discord.Embed(
@@ -249,51 +487,52 @@ class PartnershipCog(commands.Cog):
         if ctx.guild.icon:
             embed.set_thumbnail(url=ctx.guild.icon.url)
 
-        # Daily partners
-        daily_text = []
-        for user_id, invite_link, timestamp in daily_partners:
-            member = ctx.guild.get_member(user_id)
-            user_name = member.display_name if member else f"Ayrılmış Üye (ID: {user_id})"
-            server_name = await self._get_server_name_from_invite(invite_link)
-            timestamp_str = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
-            daily_text.append(f"{server_name} - {user_name} - {timestamp_str}")
-        embed.add_field(
-            name=f"Günlük Partnerlikler ({len(daily_partners)})",
-            value="\n".join(daily_text) if daily_text else "Bugün partnerlik yapılmamış.",
-            inline=False
-        )
-
-        # Monthly partners
-        monthly_text = []
-        for user_id, invite_link, timestamp in monthly_partners:
-            member = ctx.guild.get_member(user_id)
-            user_name = member.display_name if member else f"Ayrılmış Üye (ID: {user_id})"
-            server_name = await self._get_server_name_from_invite(invite_link)
-            timestamp_str = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
-            monthly_text.append(f"{server_name} - {user_name} - {timestamp_str}")
-        embed.add_field(
-            name=f"Aylık Partnerlikler ({len(monthly_partners)})",
-            value="\n".join(monthly_text) if monthly_text else "Bu ay partnerlik yapılmamış.",
-            inline=False
-        )
-
-        # Yearly partners
-        yearly_text = []
-        for user_id, invite_link, timestamp in yearly_partners:
-            member = ctx.guild.get_member(user_id)
-            user_name = member.display_name if member else f"Ayrılmış Üye (ID: {user_id})"
-            server_name = await self._get_server_name_from_invite(invite_link)
-            timestamp_str = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
-            yearly_text.append(f"{server_name} - {user_name} - {timestamp_str}")
-        embed.add_field(
-            name=f"Yıllık Partnerlikler ({len(yearly_partners)})",
-            value="\n".join(yearly_text) if yearly_text else "Bu yıl partnerlik yapılmamış.",
-            inline=False
-        )
+        for title, partners, total, empty_text in (
+            ("Günlük Partnerlikler", daily_partners, daily_count, "Bugün partnerlik yapılmamış."),
+            ("Aylık Partnerlikler", monthly_partners, monthly_count, "Bu ay partnerlik yapılmamış."),
+            ("Yıllık Partnerlikler", visible_rows, yearly_count, "Bu yıl partnerlik yapılmamış."),
+        ):
+            embed.add_field(
+                name=f"{title} ({total})",
+                value=self._format_partner_lines(partners, total, name_map, server_names) if partners else empty_text,
+                inline=False
+            )
 
         embed.set_footer(text=f"Tarih: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         await ctx.send(embed=embed)
 
+    @staticmethod
+    def _format_partner_lines(
+        partners: List[Tuple[int, str, int, Optional[str]]], total: int,
+        name_map: Dict[int, str], server_names: Dict[str, str]
+    ) -> str:
+        """Partner satırlarını bir embed alanı için biçimlendir (1024 karakter sınırına ulaşmadan durur).
+
+        ``total`` dönemin toplam kayıt sayısıdır; gösterilemeyen satırlar "+N daha" olarak belirtilir.
+        """
+        lines = PartnershipCog._fit_partner_lines(partners, name_map, server_names)
+        remaining = total - len(lines)
+        if remaining > 0:
+            lines.append(f"... (+{remaining} daha)")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _fit_partner_lines(
+        partners: List[Tuple[int, str, int, Optional[str]]], name_map: Dict[int, str], server_names: Dict[str, str]
+    ) -> List[str]:
+        """Bir embed alanına sığan partner satırlarını oluştur (adı çözülmemiş sunucular en uzun adla sayılır)."""
+        lines = []
+        length = 0
+        for user_id, invite_link, timestamp, guild_name in partners[:STATS_FIELD_MAX_ROWS]:
+            server_name = guild_name or server_names.get(invite_link) or "?" * GUILD_NAME_MAX_LENGTH
+            timestamp_str = datetime.datetime.fromtimestamp(timestamp, TURKEY_TZ).strftime("%Y-%m-%d %H:%M:%S")
+            line = f"{server_name} - {name_map[user_id]} - {timestamp_str}"
+            if length + len(line) + 1 > STATS_FIELD_CHAR_BUDGET:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        return lines
+
     @commands.command(name="partnerleaderboard")
     @commands.cooldown(1, 10, commands.BucketType.guild)
     async def partner_leaderboard_command(self, ctx: commands.Context):
@@ -301,11 +540,11 @@ class PartnershipCog(commands.Cog):
         if not ctx.guild:
             await ctx.send("Bu komut sadece sunucularda kullanılabilir.")
             return
-        if not self.conn:
+        if not self.db:
             await ctx.send("Veritabanı hatası nedeniyle lider tablosu alınamıyor.")
             return
 
-        leaderboard = self._get_leaderboard(limit=10)
+        leaderboard = await self._get_leaderboard(limit=10)
         embed = discord.Embed(
             title=f"🏆 {ctx.guild.name} Partner Lider Tablosu",
             color=discord.Color.red()  # Embed rengi kırmızı
@@ -345,21 +584,21 @@ class PartnershipCog(commands.Cog):
             await ctx.send("❓ Hata oluştu.")
 
     # --- Cog Lifecycle ---
-    def cog_unload(self):
+    async def cog_unload(self):
         """Clean up when the cog is unloaded."""
-        if self.conn:
-            self.conn.close()
+        self._prune_invite_caches.cancel()
+        # İptal yerine durdurma işareti: kuyruktaki tüm kayıtlar yazıldıktan sonra görev kendisi biter
+        if not self._writer_task.done():
+            self._write_queue.put_nowait(None)
+            await self._writer_task
+        if self.db:
+            await self.db.close()
+            self.db = None
             self.logger.info("Cog kaldırıldı, DB bağlantısı kapatıldı.")
+        self._stop_log_listener()
 
 async def setup(bot: commands.Bot):
     """Setup function to load the cog."""
-    try:
-        import sqlite3
-    except ImportError:
-        logging.error("SQLite3 modülü bulunamadı! Partner sistemi ÇALIŞMAYACAK.")
-        return
-    if not os.path.exists(DB_NAME):
-        logging.warning(f"'{DB_NAME}' veritabanı dosyası bulunamadı, ilk partner kaydında oluşturulacak.")
     await bot.add_cog(PartnershipCog(bot))
     print("✅ Partnership Cog yüklendi!")
 